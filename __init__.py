@@ -1,5 +1,12 @@
 import sys
 from . import ontotrees
-from .recommendations import Recommendation
 
 sys.modules["ontotrees"] = ontotrees
+
+from .recommendations import (
+    EmbeddingStore,
+    OntologyRegistry,
+    Recommendation,
+    RecommendationParams,
+    ReloadableRecommendation,
+)
@@ -0,0 +1,418 @@
+import argparse
+import configparser
+import itertools
+import json
+import os
+import pathlib
+import pickle
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+from ontotrees import OntologyTrees
+from recommendations import Recommendation
+
+_ROOT = pathlib.Path(__file__).parent.absolute()
+
+_RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+_RDFS = "http://www.w3.org/2000/01/rdf-schema#"
+_OWL = "http://www.w3.org/2002/07/owl#"
+_BASE = "http://example.org/synthetic#"
+
+
+def _level_sizes(classes, depth, branching):
+    # Quantidade de classes em cada nível (até depth níveis): cada nível
+    # tem "branching" vezes mais classes que o anterior. Se depth níveis não
+    # comportarem todas as classes, a razão entre os níveis aumenta para a
+    # menor que as comporte, distribuindo as restantes por todos os níveis
+    # em vez de concentrá-las no último.
+    def capacity(ratio):
+        return sum(ratio**level for level in range(depth))
+
+    ratio = float(branching)
+    if capacity(ratio) < classes:
+        low, high = ratio, float(max(classes, branching))
+        for _ in range(100):
+            middle = (low + high) / 2
+            if capacity(middle) < classes:
+                low = middle
+            else:
+                high = middle
+        ratio = high
+    sizes = []
+    total = 0
+    for level in range(depth):
+        if total >= classes:
+            break
+        width = min(max(1, round(ratio**level)), classes - total)
+        if level == depth - 1:
+            width = classes - total
+        sizes.append(width)
+        total += width
+    return sizes
+
+
+def achieved_branching(classes, depth, branching):
+    # Média de filhas por classe dos níveis com filhas, na hierarquia que
+    # generate_ontology gera para esses parâmetros
+    sizes = _level_sizes(classes, depth, branching)
+    if len(sizes) < 2:
+        return 0.0
+    return (sum(sizes) - sizes[0]) / sum(sizes[:-1])
+
+
+def generate_ontology(
+    filename,
+    classes=1000,
+    depth=6,
+    branching=4,
+    properties=None,
+    data_properties=None,
+    domains_per_property=2,
+    vocabulary=500,
+    seed=0,
+):
+    # Gera uma ontologia sintética em N-Triples com uma hierarquia de
+    # classes (depth níveis, cada classe com em média "branching" filhas,
+    # ou mais se depth níveis não comportarem as classes; ver _level_sizes),
+    # object e data properties em hierarquias mais rasas, cada uma com
+    # domains_per_property classes no domain e no range, e labels formados
+    # por palavras de um vocabulário de tamanho fixo. Para a mesma semente,
+    # o arquivo gerado é sempre o mesmo.
+    rng = random.Random(seed)
+    words = [f"w{index}" for index in range(vocabulary)]
+    if properties is None:
+        properties = max(10, classes // 20)
+    if data_properties is None:
+        data_properties = max(5, classes // 50)
+
+    def label(uri):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+        return f'<{uri}> <{_RDFS}label> "{text}" .\n'
+
+    def hierarchy(output, prefix, count, rdf_type, sub_predicate, levels):
+        uris = []
+        previous_level = []
+        for size in _level_sizes(count, levels, branching):
+            level = []
+            for _ in range(size):
+                uri = f"{_BASE}{prefix}{len(uris)}"
+                output.write(f"<{uri}> <{_RDF_TYPE}> <{rdf_type}> .\n")
+                if previous_level:
+                    parent = rng.choice(previous_level)
+                    output.write(f"<{uri}> <{sub_predicate}> <{parent}> .\n")
+                output.write(label(uri))
+                level.append(uri)
+                uris.append(uri)
+            previous_level = level
+        return uris
+
+    with open(filename, "w", encoding="utf-8") as output:
+        class_uris = hierarchy(
+            output,
+            "Class",
+            classes,
+            _OWL + "Class",
+            _RDFS + "subClassOf",
+            depth,
+        )
+        for prefix, count, rdf_type, with_range in (
+            ("objectProperty", properties, "ObjectProperty", True),
+            ("dataProperty", data_properties, "DatatypeProperty", False),
+        ):
+            uris = hierarchy(
+                output,
+                prefix,
+                count,
+                _OWL + rdf_type,
+                _RDFS + "subPropertyOf",
+                max(1, depth // 2),
+            )
+            for uri in uris:
+                for domain in rng.sample(
+                    class_uris, min(domains_per_property, len(class_uris))
+                ):
+                    output.write(f"<{uri}> <{_RDFS}domain> <{domain}> .\n")
+                if with_range:
+                    for range_uri in rng.sample(
+                        class_uris, min(domains_per_property, len(class_uris))
+                    ):
+                        output.write(
+                            f"<{uri}> <{_RDFS}range> <{range_uri}> .\n"
+                        )
+    return words
+
+
+def generate_embeddings(filename, words, size=50, seed=0):
+    # Modelo word2vec (formato texto) com vetores aleatórios para as
+    # palavras dos labels e "unk"
+    rng = random.Random(seed)
+    words = list(words) + ["unk"]
+    with open(filename, "w", encoding="utf-8") as output:
+        output.write(f"{len(words)} {size}\n")
+        for word in words:
+            vector = " ".join(f"{rng.gauss(0, 1):.5f}" for _ in range(size))
+            output.write(f"{word} {vector}\n")
+
+
+def generate_questions(trees, count, seed=0):
+    # Perguntas no formato de triplas (domain, propriedade, range) a
+    # partir das propriedades geradas, metade delas com has_value
+    rng = random.Random(seed)
+    candidates = []
+    for key, node in trees["object_properties"].items():
+        if node.domains and node.ranges:
+            candidates.append((key, node))
+    questions = []
+    for _ in range(count if candidates else 0):
+        key, node = rng.choice(candidates)
+        domain = rng.choice(node.domains)
+        range_uri = rng.choice(node.ranges)
+        question = [(domain, key, range_uri)]
+        if rng.random() < 0.5:
+            question.insert(0, (domain, "has_value", "valor"))
+        questions.append(question)
+    return questions
+
+
+def _timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+
+    def percentile(fraction):
+        index = min(
+            len(samples) - 1, int(round(fraction * (len(samples) - 1)))
+        )
+        return samples[index] * 1000
+
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": percentile(0.50),
+        "p90_ms": percentile(0.90),
+        "p99_ms": percentile(0.99),
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    classes=1000,
+    depth=6,
+    branching=4,
+    domains_per_property=2,
+    questions=200,
+    orders=("", "random", "semantic"),
+    filters=("domain", "range", "both"),
+    depths=(1, 2, 3),
+    loader="stream",
+    seed=0,
+    workdir=None,
+):
+    workdir = pathlib.Path(workdir or tempfile.mkdtemp(prefix="ontobench_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "classes": classes,
+            "depth": depth,
+            "branching": branching,
+            "branching_achieved": achieved_branching(
+                classes, depth, branching
+            ),
+            "domains_per_property": domains_per_property,
+            "questions": questions,
+            "loader": loader,
+            "seed": seed,
+        }
+    }
+
+    ontology_path = workdir / "ontology.nt"
+    words, seconds = _timed(
+        generate_ontology,
+        ontology_path,
+        classes,
+        depth,
+        branching,
+        domains_per_property=domains_per_property,
+        seed=seed,
+    )
+    results["generate_s"] = seconds
+    model_path = workdir / "model.txt"
+    generate_embeddings(model_path, words, seed=seed)
+
+    onto_trees = OntologyTrees()
+    if loader == "graph":
+        _, seconds = _timed(
+            onto_trees.load_ontology, str(ontology_path), format="nt"
+        )
+    elif loader == "parallel":
+        _, seconds = _timed(
+            onto_trees.load_ontology_parallel,
+            [str(ontology_path)],
+            format="nt",
+        )
+    else:
+        _, seconds = _timed(
+            onto_trees.load_ontology_stream, str(ontology_path), format="nt"
+        )
+    results["build_s"] = seconds
+    results["nodes"] = {
+        name: len(tree) for name, tree in onto_trees.trees.items()
+    }
+
+    trees_path = workdir / "ontology_trees.pkl"
+    with open(trees_path, "wb") as output:
+        _, seconds = _timed(
+            pickle.dump, onto_trees, output, pickle.HIGHEST_PROTOCOL
+        )
+    results["pickle_dump_s"] = seconds
+    results["pickle_bytes"] = os.path.getsize(trees_path)
+    with open(trees_path, "rb") as trees_file:
+        _, results["pickle_load_s"] = _timed(pickle.load, trees_file)
+    binary_path = workdir / "ontology_trees.bin"
+    _, results["binary_save_s"] = _timed(onto_trees.save, binary_path)
+    results["binary_bytes"] = os.path.getsize(binary_path)
+
+    # Configuração do recommendation.ini apontando para os dados gerados,
+    # sem cache, para medir o custo de cada pergunta
+    config = configparser.ConfigParser(delimiters="=")
+    config.read(os.path.join(_ROOT, "recommendation.ini"))
+    settings = config["DEFAULT"]
+    settings["trees_filename"] = str(trees_path)
+    settings["model_path"] = str(model_path)
+    settings["embeddings_path"] = ""
+    settings["tables_filename"] = ""
+    settings["cache_size"] = "0"
+    settings["load_graph"] = "no"
+    settings["startup_report"] = "no"
+    settings["order"] = "semantic"
+    config_path = workdir / "recommendation.ini"
+    with open(config_path, "w", encoding="utf-8") as config_file:
+        config.write(config_file)
+
+    recommendation, seconds = _timed(
+        Recommendation, config_path=str(config_path)
+    )
+    results["startup_s"] = seconds
+    results["startup_stages_s"] = dict(recommendation.startup_times)
+
+    question_list = generate_questions(recommendation.trees, questions, seed)
+    results["latency"] = []
+    for order, filter_by, search_depth in itertools.product(
+        orders, filters, depths
+    ):
+        params = {
+            "order": order,
+            "filter_by": filter_by,
+            "depth": search_depth,
+        }
+        samples = []
+        for question in question_list:
+            _, seconds = _timed(
+                recommendation.get_recommendations, question, params=params
+            )
+            samples.append(seconds)
+        if samples:
+            results["latency"].append({**params, **_percentiles(samples)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mede a construção das árvores, o pickle, a "
+        "inicialização da Recommendation e a latência das perguntas em uma "
+        "ontologia sintética."
+    )
+    parser.add_argument("--classes", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--branching", type=int, default=4)
+    parser.add_argument(
+        "--domains-per-property",
+        type=int,
+        default=2,
+        help="classes no domain e no range de cada propriedade",
+    )
+    parser.add_argument(
+        "--questions", type=int, default=200, help="perguntas por combinação"
+    )
+    parser.add_argument(
+        "--loader", choices=("stream", "graph", "parallel"), default="stream"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--workdir", help="diretório dos arquivos gerados (padrão: temporário)"
+    )
+    parser.add_argument(
+        "--output",
+        default=os.path.join("results", "benchmark.json"),
+        help="arquivo JSON com os resultados (padrão: results/benchmark.json)",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        classes=args.classes,
+        depth=args.depth,
+        branching=args.branching,
+        domains_per_property=args.domains_per_property,
+        questions=args.questions,
+        loader=args.loader,
+        seed=args.seed,
+        workdir=args.workdir,
+    )
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(results, output, indent=2)
+
+    print(f"nodes: {results['nodes']}")
+    branching = results["meta"]["branching_achieved"]
+    if branching > args.branching:
+        print(
+            f"{args.depth} levels do not fit {args.classes} classes with "
+            f"branching {args.branching}, the average branching is "
+            f"{branching:.1f}"
+        )
+    for stage in (
+        "build_s",
+        "pickle_dump_s",
+        "pickle_load_s",
+        "binary_save_s",
+        "startup_s",
+    ):
+        print(f"{stage:<16} {results[stage] * 1000:10.1f} ms")
+    print(f"{'order':<10}{'filter_by':<10}{'depth':>6}{'p50':>10}{'p99':>10}")
+    for row in results["latency"]:
+        print(
+            f"{row['order'] or '-':<10}{row['filter_by']:<10}"
+            f"{row['depth']:>6}{row['p50_ms']:>10.3f}{row['p99_ms']:>10.3f}"
+        )
+    print(f"Results saved as {args.output}")
+
+
+if __name__ == "__main__":
+    main()
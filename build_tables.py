@@ -0,0 +1,33 @@
+import argparse
+import pathlib
+import os
+
+from recommendations import Recommendation
+
+_ROOT = pathlib.Path(__file__).parent.absolute()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pré-calcula as recomendações de cada propriedade para a "
+        "configuração do recommendation.ini."
+    )
+    parser.add_argument(
+        "filename",
+        nargs="?",
+        default=os.path.join(_ROOT, "recommendation_tables.pkl"),
+        help="arquivo de saída",
+    )
+    parser.add_argument(
+        "--max-pairs",
+        type=int,
+        default=1000,
+        help="número máximo de pares (domain, range) por propriedade",
+    )
+    args = parser.parse_args()
+
+    Recommendation().build_tables(args.filename, args.max_pairs)
+
+
+if __name__ == "__main__":
+    main()
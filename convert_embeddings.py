@@ -0,0 +1,58 @@
+import argparse
+import pathlib
+import os
+
+from ontotrees import convert_word2vec
+from recommendations import open_trees
+
+_ROOT = pathlib.Path(__file__).parent.absolute()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Converte um modelo word2vec em formato texto para o "
+        "formato .npy, que pode ser aberto com mmap."
+    )
+    parser.add_argument("source", help="modelo word2vec em formato texto")
+    parser.add_argument("target", help="arquivo .npy de saída")
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="mantém apenas as palavras presentes nos nomes das árvores",
+    )
+    parser.add_argument(
+        "--trees",
+        default=os.path.join(_ROOT, "ontology_trees.pkl"),
+        help="árvores da ontologia usadas no --prune: um pickle (.pkl) ou o "
+        "formato binário (como o trees_filename do recommendation.ini)",
+    )
+    parser.add_argument(
+        "--ontology",
+        help="ontologia a partir da qual as árvores são construídas se o "
+        "arquivo do --trees não existir",
+    )
+    parser.add_argument("--ontology-format", default=None)
+    parser.add_argument(
+        "--labels",
+        default=os.path.join(_ROOT, "properties_labels.ini"),
+        help="labels das propriedades, usados com o --ontology",
+    )
+    args = parser.parse_args()
+
+    vocabulary = None
+    if args.prune:
+        onto_trees, _ = open_trees(
+            args.trees, args.ontology, args.ontology_format, args.labels
+        )
+        vocabulary = onto_trees.vocabulary()
+        if hasattr(onto_trees, "close"):
+            onto_trees.close()
+    word_vectors = convert_word2vec(args.source, args.target, vocabulary)
+    print(
+        f"{len(word_vectors)} vetores de dimensão "
+        f"{word_vectors.vector_size} salvos em {args.target}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import argparse
+import pickle
+
+from ontotrees import save_trees
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Converte as árvores salvas com pickle para o formato "
+        "binário, que pode ser aberto com mmap."
+    )
+    parser.add_argument(
+        "source", help="árvores da ontologia salvas com pickle"
+    )
+    parser.add_argument(
+        "target",
+        help="arquivo de saída no formato binário (indicado no "
+        "trees_filename do recommendation.ini)",
+    )
+    args = parser.parse_args()
+
+    onto_trees = pickle.load(open(args.source, "rb"))
+    save_trees(
+        args.target,
+        onto_trees.trees,
+        onto_trees.roots,
+        getattr(onto_trees, "lang", None),
+    )
+    sizes = ", ".join(
+        f"{name}: {len(tree)}" for name, tree in onto_trees.trees.items()
+    )
+    print(f"Árvores ({sizes}) salvas em {args.target}")
+
+
+if __name__ == "__main__":
+    main()
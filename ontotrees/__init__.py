@@ -1,2 +1,36 @@
+import time
+
+_import_start = time.perf_counter()
+
 from .onto_tree import OntologyTrees
 from .node import Node
+from .hierarchy_index import DomainRangeIndex, HierarchyIndex, LevelIndex
+from .cache import LRUCache
+from .compact import CompactTree, StringTable, compact_trees
+from .mapped import MappedOntologyTrees, load_trees, save_trees
+from .tracing import Trace, Tracer, current_trace
+
+# Tempo (em segundos) da importação do pacote, incluído no relatório de
+# inicialização da Recommendation
+IMPORT_TIME = time.perf_counter() - _import_start
+
+# Os embeddings dependem do numpy e do unidecode, então o módulo só é
+# importado quando um desses nomes é utilizado.
+_embeddings_names = (
+    "NeighborIndex",
+    "NodeEmbeddings",
+    "SimilarityBatcher",
+    "WordVectors",
+    "convert_word2vec",
+    "load_word_vectors",
+    "prune_word_vectors",
+    "tokenize",
+)
+
+
+def __getattr__(name):
+    if name in _embeddings_names:
+        from . import embeddings
+
+        return getattr(embeddings, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
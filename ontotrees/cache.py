@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    # Cache LRU com tamanho máximo e, opcionalmente, tempo de expiração (ttl)
+    # das entradas em segundos. Conta os acertos (hits) e as falhas (misses).
+    # on_remove(key, value) é chamado, fora do lock, para cada entrada
+    # descartada (pelo tamanho, pelo ttl, por invalidate ou clear).
+    def __init__(self, maxsize=1024, ttl=None, on_remove=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_remove = on_remove
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        expired = None
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires = item
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                expired = [(key, value)]
+            self.misses += 1
+        self.__removed(expired)
+        return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        removed = []
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                old_key, (old_value, _) = self._data.popitem(last=False)
+                removed.append((old_key, old_value))
+        self.__removed(removed)
+
+    def invalidate(self, predicate):
+        # Remove as entradas para as quais predicate(key, value) é verdadeiro
+        with self._lock:
+            removed = [
+                (key, value)
+                for key, (value, _) in self._data.items()
+                if predicate(key, value)
+            ]
+            for key, _ in removed:
+                del self._data[key]
+        self.__removed(removed)
+        return len(removed)
+
+    def clear(self):
+        with self._lock:
+            removed = []
+            if self.on_remove is not None:
+                removed = [
+                    (key, value) for key, (value, _) in self._data.items()
+                ]
+            self._data.clear()
+        self.__removed(removed)
+
+    def __removed(self, entries):
+        if self.on_remove is not None and entries:
+            for key, value in entries:
+                self.on_remove(key, value)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,209 @@
+from array import array
+from collections.abc import Mapping
+
+
+class StringTable:
+    # Tabela de strings compartilhada entre as árvores: cada URI (ou nome) é
+    # armazenada uma única vez e referenciada por um id inteiro.
+    def __init__(self, strings=()):
+        self._strings = []
+        self._ids = dict()
+        for string in strings:
+            self.add(string)
+
+    def add(self, string):
+        if string is None:
+            return -1
+        string_id = self._ids.get(string)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._strings.append(string)
+            self._ids[string] = string_id
+        return string_id
+
+    def get_id(self, string):
+        return self._ids.get(string, -1)
+
+    def __getitem__(self, string_id):
+        return None if string_id < 0 else self._strings[string_id]
+
+    def __contains__(self, string):
+        return string in self._ids
+
+    def __len__(self):
+        return len(self._strings)
+
+    def __iter__(self):
+        return iter(self._strings)
+
+
+class NodeView:
+    # Visão de um nó da CompactTree com a mesma interface de Node.
+    __slots__ = ("_tree", "_index")
+
+    def __init__(self, tree, index):
+        self._tree = tree
+        self._index = index
+
+    @property
+    def id(self):
+        return self._index
+
+    @property
+    def data(self):
+        return self._tree.strings[self._tree.keys_ids[self._index]]
+
+    @property
+    def parent(self):
+        return self._tree.strings[self._tree.parents[self._index]]
+
+    @property
+    def name(self):
+        return self._tree.strings[self._tree.names[self._index]]
+
+    @property
+    def weight(self):
+        return self._tree.weights[self._index]
+
+    @property
+    def is_leaf(self):
+        return bool(self._tree.leaves[self._index])
+
+    @property
+    def children(self):
+        return self._tree._slice("children", self._index)
+
+    @property
+    def domains(self):
+        return self._tree._slice("domains", self._index)
+
+    @property
+    def ranges(self):
+        return self._tree._slice("ranges", self._index)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, NodeView)
+            and self._tree is other._tree
+            and self._index == other._index
+        )
+
+    def __hash__(self):
+        return hash((id(self._tree), self._index))
+
+    def __repr__(self):
+        return f"NodeView({self.data!r})"
+
+
+class CompactTree(Mapping):
+    # Árvore armazenada como arrays (struct-of-arrays): cada nó recebe um id
+    # inteiro e os filhos, domains e ranges ficam em arrays no formato CSR
+    # (offsets + ids da tabela de strings). Funciona como um dicionário
+    # somente leitura de URI -> nó, assim como as árvores de OntologyTrees.
+    def __init__(self, tree, strings):
+        self.strings = strings
+        self.keys_ids = array("i")
+        self.parents = array("i")
+        self.names = array("i")
+        self.weights = array("d")
+        self.leaves = bytearray()
+        self.offsets = {
+            "children": array("i", [0]),
+            "domains": array("i", [0]),
+            "ranges": array("i", [0]),
+        }
+        self.values_ids = {
+            "children": array("i"),
+            "domains": array("i"),
+            "ranges": array("i"),
+        }
+
+        for node in tree.values():
+            self.keys_ids.append(strings.add(node.data))
+            self.parents.append(strings.add(node.parent))
+            self.names.append(strings.add(node.name))
+            self.weights.append(node.weight)
+            self.leaves.append(node.is_leaf)
+            for attr, offsets in self.offsets.items():
+                self.values_ids[attr].extend(
+                    strings.add(value) for value in getattr(node, attr)
+                )
+                offsets.append(len(self.values_ids[attr]))
+
+        # id da string -> id do nó (-1 se a string não for um nó da árvore)
+        self.node_ids = array("i", [-1]) * len(strings)
+        for index, key_id in enumerate(self.keys_ids):
+            self.node_ids[key_id] = index
+
+    @classmethod
+    def from_arrays(cls, strings, **arrays):
+        # Cria a árvore a partir de arrays já prontos (por exemplo, visões de
+        # um arquivo mapeado em memória), sem copiá-los.
+        compact = cls.__new__(cls)
+        compact.strings = strings
+        for attr in (
+            "keys_ids",
+            "parents",
+            "names",
+            "weights",
+            "leaves",
+            "offsets",
+            "values_ids",
+            "node_ids",
+        ):
+            setattr(compact, attr, arrays[attr])
+        return compact
+
+    def _slice(self, attr, index):
+        offsets = self.offsets[attr]
+        return [
+            self.strings[value_id]
+            for value_id in self.values_ids[attr][
+                offsets[index] : offsets[index + 1]
+            ]
+        ]
+
+    def get_node_id(self, key):
+        key_id = self.strings.get_id(key)
+        if 0 <= key_id < len(self.node_ids):
+            return self.node_ids[key_id]
+        return -1
+
+    def node(self, index):
+        return NodeView(self, index)
+
+    def __getitem__(self, key):
+        index = self.get_node_id(key)
+        if index < 0:
+            raise KeyError(key)
+        return NodeView(self, index)
+
+    def __contains__(self, key):
+        return self.get_node_id(key) >= 0
+
+    def __iter__(self):
+        return (self.strings[key_id] for key_id in self.keys_ids)
+
+    def items(self):
+        # Percorre os nós pelo id, sem buscar cada URI na tabela de strings
+        return (
+            (self.strings[key_id], NodeView(self, index))
+            for index, key_id in enumerate(self.keys_ids)
+        )
+
+    def values(self):
+        return (NodeView(self, index) for index in range(len(self.keys_ids)))
+
+    def __len__(self):
+        return len(self.keys_ids)
+
+
+def compact_trees(trees, strings=None):
+    # Converte as árvores de OntologyTrees para CompactTree, compartilhando
+    # uma única tabela de strings entre elas.
+    strings = StringTable() if strings is None else strings
+    compacted = {
+        hierarchy_name: CompactTree(tree, strings)
+        for hierarchy_name, tree in trees.items()
+    }
+    return compacted
@@ -0,0 +1,474 @@
+import itertools
+import os
+import threading
+
+import numpy as np
+from unidecode import unidecode
+
+
+def tokenize(text):
+    return unidecode((text or "").lower()).split()
+
+
+def trees_vocabulary(trees, unknown="unk"):
+    # Palavras presentes nos nomes dos nós das árvores
+    words = {unknown}
+    for tree in trees.values():
+        for node in tree.values():
+            words.update(tokenize(node.name))
+    return words
+
+
+class NodeEmbeddings:
+    # Guarda, em uma matriz contígua, o embedding médio normalizado do nome
+    # de cada nó das árvores (classes, object e data properties). A matriz é
+    # calculada uma única vez, de forma que a ordenação semântica se resume
+    # a um produto matriz-vetor.
+    def __init__(self, keyed_vectors, trees, unknown="unk"):
+        self.keyed_vectors = keyed_vectors
+        self.unknown = unknown
+        self._rows = dict()
+
+        nodes = []
+        for tree in trees.values():
+            for key, node in tree.items():
+                if key not in self._rows:
+                    self._rows[key] = len(nodes)
+                    nodes.append(node)
+
+        self.vectors = np.zeros(
+            (len(nodes), keyed_vectors.vector_size), dtype=np.float32
+        )
+        # Palavras de cada nó substituídas por "unk"
+        self.unknown_counts = np.zeros(len(nodes), dtype=np.int32)
+        for row, node in enumerate(nodes):
+            self.vectors[row] = self.text_vector(node.name)
+            self.unknown_counts[row] = self.count_unknown(node.name)
+
+    def update(self, trees, keys):
+        # Recalcula os vetores dos nós alterados, acrescentando linhas para
+        # os nós novos. Linhas de nós removidos deixam de ser consultadas.
+        nodes = dict()
+        for tree in trees.values():
+            for key in keys:
+                if key in tree and key not in nodes:
+                    nodes[key] = tree[key]
+        new_keys = [key for key in nodes if key not in self._rows]
+        if new_keys:
+            for key in new_keys:
+                self._rows[key] = len(self._rows)
+            self.vectors = np.vstack(
+                [
+                    self.vectors,
+                    np.zeros(
+                        (len(new_keys), self.vectors.shape[1]),
+                        dtype=np.float32,
+                    ),
+                ]
+            )
+            self.unknown_counts = np.concatenate(
+                [self.unknown_counts, np.zeros(len(new_keys), dtype=np.int32)]
+            )
+        for key, node in nodes.items():
+            self.vectors[self._rows[key]] = self.text_vector(node.name)
+            self.unknown_counts[self._rows[key]] = self.count_unknown(
+                node.name
+            )
+
+    def words(self, text):
+        # Palavras fora do vocabulário são substituídas por "unk"
+        words = [
+            word if word in self.keyed_vectors else self.unknown
+            for word in tokenize(text)
+        ]
+        return [word for word in words if word in self.keyed_vectors]
+
+    def count_unknown(self, text):
+        return sum(
+            1 for word in tokenize(text) if word not in self.keyed_vectors
+        )
+
+    def unknown_words(self, nodes):
+        # Total de substituições por "unk" nos nomes dos nós
+        total = 0
+        for node in nodes:
+            row = self._rows.get(node.data)
+            if row is None:
+                total += self.count_unknown(node.name)
+            else:
+                total += int(self.unknown_counts[row])
+        return total
+
+    def text_vector(self, text):
+        words = self.words(text)
+        if not words:
+            return np.zeros(self.keyed_vectors.vector_size, dtype=np.float32)
+        mean = np.asarray(self.keyed_vectors[words]).mean(axis=0)
+        norm = np.linalg.norm(mean)
+        if norm > 0:
+            mean = mean / norm
+        return mean
+
+    def node_vector(self, node):
+        row = self._rows.get(node.data)
+        if row is None:
+            return self.text_vector(node.name)
+        return self.vectors[row]
+
+    def similarities(self, source, targets):
+        rows = [self._rows.get(node.data) for node in targets]
+        if None in rows:
+            matrix = np.vstack([self.node_vector(node) for node in targets])
+        else:
+            matrix = self.vectors[rows]
+        return matrix @ self.node_vector(source)
+
+    def rank(self, source, targets, threshold=-1.0, limit=None):
+        if not targets:
+            return []
+        return _rank(
+            self.similarities(source, targets), targets, threshold, limit
+        )
+
+
+def _rank(scores, targets, threshold=-1.0, limit=None):
+    # Ordena os alvos do mais similar para o menos similar, mantendo a
+    # ordem original em caso de empate e descartando os que estiverem
+    # abaixo do limiar.
+    candidates = np.flatnonzero(scores >= threshold)
+    if limit and len(candidates) > limit:
+        top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+        kth = scores[candidates[top]].min()
+        candidates = candidates[scores[candidates] >= kth]
+    order = np.lexsort((candidates, -scores[candidates]))
+    ranked = [targets[index] for index in candidates[order]]
+    return ranked[:limit] if limit is not None else ranked
+
+
+class SimilarityBatcher:
+    # Agrupa as similaridades pedidas por várias threads ao mesmo tempo em
+    # um único produto de matrizes. A primeira thread de cada janela espera
+    # "window" segundos (ou até max_batch pedidos), calcula o lote inteiro
+    # e entrega o resultado às demais. Se nenhuma outra thread estiver
+    # calculando similaridades, não há o que agrupar e a espera é pulada.
+    # Os outros atributos são os do NodeEmbeddings original.
+    def __init__(self, node_embeddings, window=0.002, max_batch=64):
+        self.node_embeddings = node_embeddings
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.requests = 0
+        self._pending = []
+        self._active = 0
+        self._lock = threading.Lock()
+        self._full = threading.Event()
+
+    def similarities(self, source, targets):
+        node_embeddings = self.node_embeddings
+        rows = [node_embeddings._rows.get(node.data) for node in targets]
+        if None in rows:
+            return node_embeddings.similarities(source, targets)
+
+        request = [node_embeddings.node_vector(source), rows, None]
+        done = threading.Event()
+        with self._lock:
+            self._pending.append((request, done))
+            self._active += 1
+            leader = len(self._pending) == 1
+            contended = self._active > 1
+            if len(self._pending) >= self.max_batch:
+                self._full.set()
+        try:
+            if not leader:
+                done.wait()
+            else:
+                if contended:
+                    self._full.wait(self.window)
+                with self._lock:
+                    batch, self._pending = self._pending, []
+                    self._full.clear()
+                try:
+                    self._compute(batch)
+                except Exception as error:
+                    for item, _ in batch:
+                        item[2] = error
+                finally:
+                    for _, event in batch:
+                        event.set()
+        finally:
+            with self._lock:
+                self._active -= 1
+        if isinstance(request[2], Exception):
+            raise request[2]
+        return request[2]
+
+    def _compute(self, batch):
+        # Linhas de todos os pedidos, sem repetição, contra todas as origens
+        all_rows = np.concatenate([np.asarray(item[1]) for item, _ in batch])
+        unique, inverse = np.unique(all_rows, return_inverse=True)
+        sources = np.vstack([item[0] for item, _ in batch])
+        scores = self.node_embeddings.vectors[unique] @ sources.T
+        start = 0
+        for column, (item, _) in enumerate(batch):
+            end = start + len(item[1])
+            item[2] = scores[inverse[start:end], column]
+            start = end
+        self.batches += 1
+        self.requests += len(batch)
+
+    def rank(self, source, targets, threshold=-1.0, limit=None):
+        if not targets:
+            return []
+        return _rank(
+            self.similarities(source, targets), targets, threshold, limit
+        )
+
+    def __getattr__(self, name):
+        if name == "node_embeddings":
+            raise AttributeError(name)
+        return getattr(self.node_embeddings, name)
+
+
+class NeighborIndex:
+    # Índice de vizinhos mais próximos dos embeddings dos nós de uma árvore
+    # (as chaves em "keys"). Os vetores são copiados para uma matriz
+    # própria, e a busca exata é feita em blocos de block_size linhas,
+    # mantendo apenas os k melhores de cada bloco. Com approximate=True, os
+    # vetores são agrupados por k-means em "lists" listas e apenas as
+    # "probes" listas mais próximas da consulta são percorridas, o que
+    # reduz o custo em árvores grandes ao preço de eventuais vizinhos
+    # perdidos.
+    def __init__(
+        self,
+        node_embeddings,
+        keys,
+        approximate=False,
+        block_size=4096,
+        lists=None,
+        probes=16,
+        seed=0,
+    ):
+        rows = node_embeddings._rows
+        self.keys = [key for key in keys if key in rows]
+        self._positions = {key: index for index, key in enumerate(self.keys)}
+        self.vectors = np.ascontiguousarray(
+            node_embeddings.vectors[[rows[key] for key in self.keys]]
+        )
+        self.block_size = block_size
+        self.probes = probes
+        self.centroids = None
+        self._lists = None
+        if approximate and len(self.keys) > 0:
+            self.__train(lists or int(np.sqrt(len(self.keys))) or 1, seed)
+
+    def __train(self, lists, seed, iterations=10):
+        # k-means esférico: os vetores já estão normalizados, então cada um
+        # é atribuído ao centróide de maior produto interno
+        rng = np.random.default_rng(seed)
+        lists = min(lists, len(self.keys))
+        centroids = self.vectors[
+            rng.choice(len(self.keys), lists, replace=False)
+        ].copy()
+        for _ in range(iterations):
+            assignment = self.__assign(centroids)
+            for index in range(lists):
+                members = self.vectors[assignment == index]
+                if len(members):
+                    mean = members.mean(axis=0)
+                    norm = np.linalg.norm(mean)
+                    centroids[index] = mean / norm if norm > 0 else mean
+        assignment = self.__assign(centroids)
+        self.centroids = centroids
+        self._lists = [
+            np.flatnonzero(assignment == index) for index in range(lists)
+        ]
+
+    def __assign(self, centroids):
+        assignment = np.empty(len(self.vectors), dtype=np.int64)
+        for start in range(0, len(self.vectors), self.block_size):
+            block = self.vectors[start : start + self.block_size]
+            assignment[start : start + len(block)] = np.argmax(
+                block @ centroids.T, axis=1
+            )
+        return assignment
+
+    def search(self, vector, k=10):
+        # Posições dos k vetores mais similares, do mais para o menos
+        # similar (em caso de empate, na ordem das chaves)
+        if self.centroids is not None:
+            probes = min(self.probes, len(self._lists))
+            closest = np.argpartition(-(self.centroids @ vector), probes - 1)
+            candidates = np.sort(
+                np.concatenate(
+                    [self._lists[index] for index in closest[:probes]]
+                )
+            )
+            scores = self.vectors[candidates] @ vector
+        else:
+            candidates = []
+            scores = []
+            for start in range(0, len(self.vectors), self.block_size):
+                block_scores = (
+                    self.vectors[start : start + self.block_size] @ vector
+                )
+                top = _top(block_scores, k)
+                candidates.append(top + start)
+                scores.append(block_scores[top])
+            if not candidates:
+                return np.empty(0, dtype=np.int64)
+            candidates = np.concatenate(candidates)
+            scores = np.concatenate(scores)
+        top = _top(scores, k)
+        order = np.lexsort((candidates[top], -scores[top]))
+        return candidates[top[order]]
+
+    def neighbors(self, key, k=10):
+        return list(itertools.islice(self.iter_neighbors(key, k), k))
+
+    def iter_neighbors(self, key, k=16):
+        # Vizinhos de key (sem ela mesma) do mais para o menos similar. A
+        # busca é refeita com o dobro de vizinhos quando os anteriores se
+        # esgotam.
+        position = self._positions.get(key)
+        if position is None:
+            return
+        vector = self.vectors[position]
+        seen = {position}
+        while True:
+            k = min(k, len(self.keys))
+            positions = self.search(vector, k)
+            for item in positions:
+                if item not in seen:
+                    seen.add(item)
+                    yield self.keys[item]
+            if len(positions) < k or k >= len(self.keys):
+                return
+            k *= 2
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def _top(scores, k):
+    # Índices dos k maiores valores (sem ordem)
+    if k >= len(scores):
+        return np.arange(len(scores))
+    return np.argpartition(-scores, k - 1)[:k]
+
+
+class WordVectors:
+    # Vetores de palavras armazenados em formato NumPy (.npy), com o
+    # vocabulário em um arquivo texto ao lado (.vocab). O arquivo .npy pode
+    # ser aberto com mmap, sendo compartilhado entre processos pelo cache de
+    # páginas do sistema operacional.
+    def __init__(self, words, vectors):
+        self.words = list(words)
+        self.vectors = vectors
+        self.index = dict()
+        for row, word in enumerate(self.words):
+            # Palavras repetidas mantêm o primeiro vetor, como no gensim
+            self.index.setdefault(word, row)
+
+    @property
+    def vector_size(self):
+        return self.vectors.shape[1]
+
+    def __contains__(self, word):
+        return word in self.index
+
+    def __getitem__(self, words):
+        if isinstance(words, str):
+            return self.vectors[self.index[words]]
+        return self.vectors[[self.index[word] for word in words]]
+
+    def __len__(self):
+        return len(self.words)
+
+    def save(self, path):
+        np.save(path, np.asarray(self.vectors, dtype=np.float32))
+        with open(_vocab_path(path), "w", encoding="utf-8") as vocab_file:
+            for word in self.words:
+                vocab_file.write(word + "\n")
+
+    @classmethod
+    def load(cls, path, mmap="r"):
+        with open(_vocab_path(path), encoding="utf-8") as vocab_file:
+            words = [line.rstrip("\n") for line in vocab_file]
+        return cls(words, np.load(path, mmap_mode=mmap))
+
+
+def _vocab_path(path):
+    return os.path.splitext(path)[0] + ".vocab"
+
+
+def _read_word2vec(path):
+    # Lê o formato texto do word2vec linha a linha, sem carregar o arquivo
+    # inteiro na memória.
+    with open(path, encoding="utf-8", errors="ignore") as model_file:
+        count, size = (int(value) for value in model_file.readline().split())
+        yield count, size
+        for line_number, line in enumerate(model_file, start=2):
+            parts = line.rstrip().rsplit(" ", size)
+            if len(parts) != size + 1:
+                raise ValueError(
+                    f"Invalid vector at line {line_number} of {path}."
+                )
+            yield parts[0], np.asarray(parts[1:], dtype=np.float32)
+
+
+def convert_word2vec(source, target, vocabulary=None):
+    # Converte um modelo word2vec em formato texto para o formato .npy.
+    # Se "vocabulary" for informado, apenas essas palavras são mantidas.
+    rows = _read_word2vec(source)
+    count, size = next(rows)
+    words = []
+    if vocabulary is None:
+        vectors = np.lib.format.open_memmap(
+            target, mode="w+", dtype=np.float32, shape=(count, size)
+        )
+        for row, (word, vector) in enumerate(rows):
+            words.append(word)
+            vectors[row] = vector
+        if len(words) != count:
+            raise ValueError(f"Expected {count} vectors in {source}.")
+        vectors.flush()
+        with open(_vocab_path(target), "w", encoding="utf-8") as vocab_file:
+            for word in words:
+                vocab_file.write(word + "\n")
+        return WordVectors(words, vectors)
+
+    vocabulary = set(vocabulary)
+    vectors = []
+    for word, vector in rows:
+        if word in vocabulary:
+            words.append(word)
+            vectors.append(vector)
+    word_vectors = WordVectors(
+        words, np.asarray(vectors, dtype=np.float32).reshape(-1, size)
+    )
+    word_vectors.save(target)
+    return word_vectors
+
+
+def prune_word_vectors(source, target, vocabulary):
+    # Extrai de um modelo (texto ou .npy) apenas os vetores das palavras do
+    # vocabulário, salvando-os em um arquivo .npy pequeno.
+    if not source.endswith(".npy"):
+        return convert_word2vec(source, target, vocabulary)
+    word_vectors = WordVectors.load(source)
+    words = [word for word in sorted(set(vocabulary)) if word in word_vectors]
+    pruned = WordVectors(words, np.asarray(word_vectors[words]))
+    pruned.save(target)
+    return pruned
+
+
+def load_word_vectors(path, mmap="r"):
+    # Arquivos .npy são abertos com mmap, os demais são tratados como
+    # modelos word2vec em formato texto.
+    if path.endswith(".npy"):
+        return WordVectors.load(path, mmap=mmap)
+    from gensim.models import KeyedVectors
+
+    return KeyedVectors.load_word2vec_format(
+        path, binary=False, unicode_errors="ignore"
+    )
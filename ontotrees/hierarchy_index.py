@@ -0,0 +1,401 @@
+from bisect import bisect_left
+from collections import deque
+
+
+class HierarchyIndex:
+    # Índice de ancestrais de uma hierarquia (classes ou propriedades),
+    # construído a partir dos filhos de cada nó, que responde "A é
+    # descendente de B?" em O(1), sem percorrer o grafo.
+    #
+    # As arestas dos nós com um único pai formam uma floresta, numerada em
+    # pré-ordem: B é ancestral de A na floresta se o intervalo da subárvore
+    # de B contém A. Os nós com mais de um pai (herança múltipla) são
+    # raízes da floresta e são os únicos que guardam o conjunto de
+    # ancestrais, então a memória é proporcional ao número de nós e não à
+    # soma das profundidades.
+    def __init__(self, tree):
+        self.__build(tree)
+
+    def __build(self, tree):
+        # Pais (na árvore) e filhos de cada nó
+        self._parents = dict()
+        self._children = dict()
+        for key, node in tree.items():
+            self._children[key] = tuple(node.children)
+            for child in dict.fromkeys(node.children):
+                if child in tree:
+                    self._parents.setdefault(child, []).append(key)
+        for key, parents in self._parents.items():
+            self._parents[key] = tuple(parents)
+
+        # Pré-ordem da floresta: _positions[chave] é a posição do nó e
+        # _ends, por posição, o fim da sua subárvore. Nós em ciclos de pais
+        # únicos não são alcançados.
+        self._keys = []
+        self._positions = dict()
+        self._ends = []
+        tops = []
+        multiple = []
+        for key in tree:
+            parents = self._parents.get(key, ())
+            if len(parents) == 1:
+                continue
+            if parents:
+                multiple.append(key)
+            top = len(self._keys)
+            stack = [(top, iter(tree[key].children))]
+            self.__visit(key, tops, top)
+            while stack:
+                position, children = stack[-1]
+                child = next(children, None)
+                if child is None:
+                    stack.pop()
+                    self._ends[position] = len(self._keys)
+                elif len(self._parents.get(child, ())) == 1 and (
+                    child not in self._positions
+                ):
+                    stack.append((len(self._keys), iter(tree[child].children)))
+                    self.__visit(child, tops, top)
+
+        # Ancestrais da raiz de cada posição, se ela tiver mais de um pai
+        closures = self.__close(multiple, tops)
+        self._closures = [closures.get(self._keys[top]) for top in tops]
+
+    def __visit(self, key, tops, top):
+        self._positions[key] = len(self._keys)
+        self._keys.append(key)
+        self._ends.append(len(self._keys))
+        tops.append(top)
+
+    def __close(self, multiple, tops):
+        # Ancestrais dos nós com mais de um pai, em ordem topológica: cada
+        # um depende das raízes (com herança múltipla) dos seus pais. Os que
+        # ficam em ciclos, e as suas subárvores, ficam fora do índice.
+        closures = dict()
+        depends = dict()
+        waiting = dict()
+        for key in multiple:
+            depends[key] = 0
+            for parent in self._parents[key]:
+                position = self._positions.get(parent)
+                if position is None:
+                    depends[key] = None
+                    break
+                top = self._keys[tops[position]]
+                if len(self._parents.get(top, ())) > 1:
+                    depends[key] += 1
+                    waiting.setdefault(top, []).append(key)
+        queue = deque(key for key, count in depends.items() if count == 0)
+        while queue:
+            key = queue.popleft()
+            ancestors = set()
+            for parent in self._parents[key]:
+                ancestors.add(parent)
+                top = self._keys[tops[self._positions[parent]]]
+                ancestors.update(self.__path(parent))
+                ancestors.update(closures.get(top, ()))
+            closures[key] = frozenset(ancestors)
+            for other in waiting.get(key, ()):
+                if depends[other] is not None:
+                    depends[other] -= 1
+                    if depends[other] == 0:
+                        queue.append(other)
+        for key in multiple:
+            if key not in closures:
+                position = self._positions[key]
+                for other in self._keys[position : self._ends[position]]:
+                    self._positions.pop(other, None)
+        return closures
+
+    def __path(self, key):
+        # Ancestrais na floresta, até a raiz
+        path = []
+        parents = self._parents.get(key, ())
+        while len(parents) == 1:
+            key = parents[0]
+            path.append(key)
+            parents = self._parents.get(key, ())
+        return path
+
+    def update(self, tree, keys):
+        # Atualiza o índice depois que os nós em "keys" foram adicionados,
+        # removidos ou tiveram seus filhos alterados. A numeração é refeita,
+        # e os ancestrais são comparados apenas para esses nós, seus filhos
+        # (antigos e novos) e descendentes. Retorna os nós cujos ancestrais
+        # mudaram.
+        pending = list(keys)
+        for key in keys:
+            pending.extend(self._children.get(key, ()))
+            if key in tree:
+                pending.extend(tree[key].children)
+        affected = set()
+        while pending:
+            key = pending.pop()
+            if key not in affected:
+                affected.add(key)
+                pending.extend(self._children.get(key, ()))
+
+        previous = {
+            key: self.ancestors(key) if key in self else None
+            for key in affected
+        }
+        self.__build(tree)
+        return {
+            key
+            for key, ancestors in previous.items()
+            if (self.ancestors(key) if key in self else None) != ancestors
+        }
+
+    def is_descendant(self, node, ancestor):
+        position = self._positions.get(node)
+        if position is None:
+            return False
+        other = self._positions.get(ancestor, position)
+        if other < position < self._ends[other]:
+            return True
+        closure = self._closures[position]
+        return closure is not None and ancestor in closure
+
+    def ancestors(self, node):
+        position = self._positions.get(node)
+        if position is None:
+            return frozenset()
+        closure = self._closures[position]
+        return frozenset(self.__path(node)).union(closure or ())
+
+    def __contains__(self, node):
+        return node in self._positions
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __iter__(self):
+        return iter(self._positions)
+
+
+class DomainRangeIndex:
+    # Índice invertido de uma árvore de propriedades: para cada classe,
+    # guarda as propriedades cujo domain (ou range) a cobre, isto é, que
+    # seja a própria classe ou um de seus ancestrais.
+    def __init__(self, properties, classes_index):
+        self._index = {"domain": dict(), "range": dict()}
+        for list_ref, attr in (("domain", "domains"), ("range", "ranges")):
+            by_class = dict()
+            for key, node in properties.items():
+                for class_uri in getattr(node, attr):
+                    by_class.setdefault(class_uri, set()).add(key)
+
+            index = self._index[list_ref]
+            # Classes fora da hierarquia cobrem apenas a si mesmas
+            for class_uri, keys in by_class.items():
+                if class_uri not in classes_index:
+                    index[class_uri] = frozenset(keys)
+            for class_uri in classes_index:
+                keys = set(by_class.get(class_uri, ()))
+                for ancestor in classes_index.ancestors(class_uri):
+                    keys.update(by_class.get(ancestor, ()))
+                if keys:
+                    index[class_uri] = frozenset(keys)
+
+    def properties(self, class_uri, list_ref="domain"):
+        return self._index[list_ref].get(class_uri, frozenset())
+
+    def items(self, list_ref="domain"):
+        return self._index[list_ref].items()
+
+
+class LevelIndex:
+    # Índice de níveis de uma árvore, usado nas buscas a partir do nó de
+    # referência (family_position e depth):
+    #
+    # - ancestor: o k-ésimo ancestral de um nó (seguindo node.parent) em
+    #   O(1), com ponteiros de salto (o ancestral 2^i níveis acima) e
+    #   escadas (caminhos longos estendidos para cima), como no algoritmo de
+    #   Bender e Farach-Colton;
+    # - descendants: os descendentes de um nó (seguindo node.children) a
+    #   cada profundidade relativa em O(log n + saída). Os nós são
+    #   numerados em pré-ordem e agrupados por profundidade, então os
+    #   descendentes de um nó em uma profundidade formam um intervalo
+    #   contíguo do grupo, já na ordem da busca em largura.
+    #
+    # Com herança múltipla, um nó aparece uma vez abaixo de cada pai (como
+    # na busca em largura). Se isso fizer a numeração passar de max_size
+    # entradas, descendants não fica disponível (available é falso) e a
+    # busca em largura deve ser usada. Nada é recursivo, então hierarquias
+    # profundas não atingem o limite de recursão do Python.
+    def __init__(self, tree, max_size=None):
+        self._keys = list(tree)
+        self._ids = {key: index for index, key in enumerate(self._keys)}
+        self.__build_ancestors(tree)
+        if max_size is None:
+            max_size = 8 * len(self._keys) + 1024
+        self.available = self.__build_levels(tree, max_size)
+
+    def __build_ancestors(self, tree):
+        ids = self._ids
+        size = len(self._keys)
+        parent = [ids.get(tree[key].parent, -1) for key in self._keys]
+        depth = [-1] * size
+        for start in range(size):
+            while depth[start] < 0:
+                path = []
+                on_path = set()
+                node = start
+                while node != -1 and depth[node] < 0 and node not in on_path:
+                    on_path.add(node)
+                    path.append(node)
+                    node = parent[node]
+                if node != -1 and depth[node] < 0:
+                    # Ciclo: o nó repetido passa a ser uma raiz
+                    parent[node] = -1
+                    continue
+                for node in reversed(path):
+                    up = parent[node]
+                    depth[node] = depth[up] + 1 if up != -1 else 0
+        self._depth = depth
+
+        # Altura de cada nó e o filho do caminho mais longo até uma folha
+        height = [0] * size
+        heavy = [-1] * size
+        for node in sorted(range(size), key=depth.__getitem__, reverse=True):
+            up = parent[node]
+            if up != -1 and (heavy[up] == -1 or height[node] + 1 > height[up]):
+                height[up] = height[node] + 1
+                heavy[up] = node
+
+        # Escadas: cada caminho longo, do topo até a folha, precedido de até
+        # o mesmo número de ancestrais acima do topo
+        self._ladders = []
+        self._ladder = [0] * size
+        self._position = [0] * size
+        for top in range(size):
+            up = parent[top]
+            if up != -1 and heavy[up] == top:
+                continue
+            path = []
+            node = top
+            while node != -1:
+                path.append(node)
+                node = heavy[node]
+            extension = []
+            node = parent[top]
+            while node != -1 and len(extension) < len(path):
+                extension.append(node)
+                node = parent[node]
+            ladder = extension[::-1] + path
+            for position in range(len(extension), len(ladder)):
+                self._ladder[ladder[position]] = len(self._ladders)
+                self._position[ladder[position]] = position
+            self._ladders.append(ladder)
+
+        # Ponteiros de salto: _jumps[i][node] é o ancestral 2^i níveis acima
+        self._jumps = [parent]
+        for _ in range(max(depth, default=0).bit_length() - 1):
+            previous = self._jumps[-1]
+            self._jumps.append(
+                [previous[up] if up != -1 else -1 for up in previous]
+            )
+
+    def __build_levels(self, tree, max_size):
+        # Pré-ordem sobre os filhos de cada nó. Cada entrada guarda a chave,
+        # a profundidade e o fim da sua subárvore na numeração.
+        ids = self._ids
+        referenced = {
+            child
+            for key in self._keys
+            for child in tree[key].children
+            if child in ids
+        }
+        entry_keys = []
+        entry_depths = []
+        entry_ends = []
+        self._first = dict()
+        starts = [key for key in self._keys if key not in referenced]
+        starts.extend(key for key in self._keys if key in referenced)
+        for start in starts:
+            if start in self._first:
+                continue
+            # Pilha de (entrada, filhos restantes); nós já no caminho atual
+            # (ciclos) não são repetidos
+            on_path = {start}
+            self._first[start] = len(entry_keys)
+            entry_keys.append(start)
+            entry_depths.append(0)
+            entry_ends.append(0)
+            stack = [(len(entry_keys) - 1, iter(tree[start].children))]
+            while stack:
+                entry, children = stack[-1]
+                child = next(children, None)
+                while child is not None and (
+                    child not in ids or child in on_path
+                ):
+                    child = next(children, None)
+                if child is None:
+                    stack.pop()
+                    on_path.discard(entry_keys[entry])
+                    entry_ends[entry] = len(entry_keys)
+                    continue
+                if len(entry_keys) >= max_size:
+                    return False
+                on_path.add(child)
+                self._first.setdefault(child, len(entry_keys))
+                entry_keys.append(child)
+                entry_depths.append(entry_depths[entry] + 1)
+                entry_ends.append(0)
+                stack.append((len(entry_keys) - 1, iter(tree[child].children)))
+        self._ends = entry_ends
+        self._entry_depths = entry_depths
+
+        # Por profundidade, as posições (crescentes) e as chaves das entradas
+        self._level_positions = []
+        self._level_keys = []
+        for position, (key, depth) in enumerate(zip(entry_keys, entry_depths)):
+            if depth == len(self._level_positions):
+                self._level_positions.append([])
+                self._level_keys.append([])
+            self._level_positions[depth].append(position)
+            self._level_keys[depth].append(key)
+        return True
+
+    def depth(self, key):
+        return self._depth[self._ids[key]]
+
+    def ancestor(self, key, k, stop=None):
+        # k-ésimo ancestral de key, parando em stop (se for um ancestral) ou
+        # no topo da hierarquia
+        node = self._ids[key]
+        k = min(k, self._depth[node])
+        stop_id = self._ids.get(stop)
+        if stop_id is not None:
+            distance = self._depth[node] - self._depth[stop_id]
+            if (
+                0 <= distance <= k
+                and self.__ancestor(node, distance) == stop_id
+            ):
+                k = distance
+        return self._keys[self.__ancestor(node, k)]
+
+    def __ancestor(self, node, k):
+        if k <= 0:
+            return node
+        level = k.bit_length() - 1
+        up = self._jumps[level][node]
+        ladder = self._ladders[self._ladder[up]]
+        return ladder[self._position[up] - (k - (1 << level))]
+
+    def descendants(self, key, depth):
+        # Chaves nas profundidades relativas 0..depth-1 a partir de key, na
+        # ordem da busca em largura
+        start = self._first.get(key)
+        if start is None:
+            return
+        end = self._ends[start]
+        first_level = self._entry_depths[start]
+        last_level = min(first_level + depth, len(self._level_positions))
+        for level in range(first_level, last_level):
+            positions = self._level_positions[level]
+            low = bisect_left(positions, start)
+            high = bisect_left(positions, end, low)
+            if low == high:
+                break
+            yield from self._level_keys[level][low:high]
@@ -0,0 +1,261 @@
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+from .compact import CompactTree, StringTable, compact_trees
+
+# Formato binário das árvores (versão 1)
+#
+# O arquivo pode ser aberto com mmap e consultado sem ser desserializado:
+#
+#   magic        8 bytes   b"ONTOTREE"
+#   version      uint32    versão do formato (little-endian)
+#   header_size  uint32    tamanho do cabeçalho JSON (little-endian)
+#   header       JSON      {"version", "byteorder", "lang", "trees", "roots",
+#                           "sections": {nome: [offset, tamanho, typecode]}}
+#   seções       arrays    alinhados em 8 bytes; os offsets são relativos ao
+#                          fim do cabeçalho (também alinhado em 8 bytes)
+#
+# Seções da tabela de strings (URIs e nomes, cada uma armazenada uma vez):
+#
+#   strings.offsets  q  início de cada string em strings.data (n + 1)
+#   strings.data     B  strings em UTF-8
+#   strings.sorted   i  ids das strings ordenados pelos bytes, usado na
+#                       busca binária URI -> id
+#
+# Seções de cada árvore <t> (classes, object_properties, data_properties),
+# indexadas pelo id do nó; os valores são ids da tabela de strings (-1 para
+# None), e filhos, domains e ranges usam o formato CSR (offsets + valores):
+#
+#   <t>.keys, <t>.parents, <t>.names             i
+#   <t>.weights                                  d
+#   <t>.leaves                                   B
+#   <t>.children.offsets, <t>.children           i
+#   <t>.domains.offsets, <t>.domains             i
+#   <t>.ranges.offsets, <t>.ranges               i
+#   <t>.node_ids                                 i  id da string -> id do nó
+
+_MAGIC = b"ONTOTREE"
+_VERSION = 1
+_PREAMBLE = struct.Struct("<8sII")
+_LISTS = ("children", "domains", "ranges")
+
+
+def _align(size, alignment=8):
+    return (size + alignment - 1) // alignment * alignment
+
+
+def save_trees(filename, trees, roots, lang=None):
+    table = StringTable()
+    compact = compact_trees(trees, table)
+    strings = [string.encode("utf-8") for string in table]
+
+    sections = []
+    offsets = array("q", [0])
+    for string in strings:
+        offsets.append(offsets[-1] + len(string))
+    sections.append(("strings.offsets", offsets))
+    sections.append(("strings.data", array("B", b"".join(strings))))
+    sections.append(
+        (
+            "strings.sorted",
+            array("i", sorted(range(len(strings)), key=strings.__getitem__)),
+        )
+    )
+    for name, tree in compact.items():
+        sections.append((f"{name}.keys", tree.keys_ids))
+        sections.append((f"{name}.parents", tree.parents))
+        sections.append((f"{name}.names", tree.names))
+        sections.append((f"{name}.weights", tree.weights))
+        sections.append((f"{name}.leaves", array("B", tree.leaves)))
+        for attr in _LISTS:
+            sections.append((f"{name}.{attr}.offsets", tree.offsets[attr]))
+            sections.append((f"{name}.{attr}", tree.values_ids[attr]))
+        node_ids = array("i", tree.node_ids)
+        node_ids.extend(array("i", [-1]) * (len(strings) - len(node_ids)))
+        sections.append((f"{name}.node_ids", node_ids))
+
+    index = dict()
+    position = 0
+    for name, values in sections:
+        size = len(values) * values.itemsize
+        index[name] = [position, size, values.typecode]
+        position = _align(position + size)
+
+    header = json.dumps(
+        {
+            "version": _VERSION,
+            "byteorder": sys.byteorder,
+            "lang": lang,
+            "trees": list(compact),
+            "roots": dict(roots),
+            "sections": index,
+        }
+    ).encode("utf-8")
+
+    with open(filename, "wb") as output:
+        output.write(_PREAMBLE.pack(_MAGIC, _VERSION, len(header)))
+        output.write(header)
+        output.write(b"\0" * (_align(output.tell()) - output.tell()))
+        base = output.tell()
+        for name, values in sections:
+            output.write(b"\0" * (base + index[name][0] - output.tell()))
+            output.write(values.tobytes())
+
+
+class MappedStringTable:
+    # Tabela de strings lida diretamente do arquivo mapeado em memória
+    def __init__(self, offsets, data, order):
+        self._offsets = offsets
+        self._data = data
+        self._order = order
+
+    def _bytes(self, string_id):
+        return self._data[
+            self._offsets[string_id] : self._offsets[string_id + 1]
+        ]
+
+    def get_id(self, string):
+        target = string.encode("utf-8")
+        low, high = 0, len(self._order)
+        while low < high:
+            middle = (low + high) // 2
+            if self._bytes(self._order[middle]).tobytes() < target:
+                low = middle + 1
+            else:
+                high = middle
+        if (
+            low < len(self._order)
+            and self._bytes(self._order[low]).tobytes() == target
+        ):
+            return self._order[low]
+        return -1
+
+    def __getitem__(self, string_id):
+        if string_id < 0:
+            return None
+        return self._bytes(string_id).tobytes().decode("utf-8")
+
+    def __contains__(self, string):
+        return self.get_id(string) >= 0
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __iter__(self):
+        return (self[string_id] for string_id in range(len(self)))
+
+
+class MappedOntologyTrees:
+    # Árvores de OntologyTrees abertas a partir do formato binário. Os
+    # arrays são visões do arquivo mapeado, compartilhadas entre processos
+    # pelo cache de páginas, e as árvores funcionam como CompactTree. close
+    # (ou o bloco with) libera o mapeamento; as árvores deixam de poder ser
+    # consultadas.
+    def __init__(self, filename):
+        with open(filename, "rb") as trees_file:
+            self._mmap = mmap.mmap(
+                trees_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        view = memoryview(self._mmap)
+        magic, version, header_size = _PREAMBLE.unpack_from(view)
+        if magic != _MAGIC:
+            raise ValueError(f"{filename} is not an ontology trees file.")
+        if version != _VERSION:
+            raise ValueError(
+                f"Unsupported ontology trees format version {version}."
+            )
+        start = _PREAMBLE.size
+        header = json.loads(bytes(view[start : start + header_size]))
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{filename} was written on another byte order.")
+        base = _align(start + header_size)
+
+        # Visões liberadas em close, antes do mmap
+        self._views = [view]
+
+        def section(name):
+            offset, size, typecode = header["sections"][name]
+            self._views.append(
+                view[base + offset : base + offset + size].cast(typecode)
+            )
+            return self._views[-1]
+
+        self.lang = header["lang"]
+        self.strings = MappedStringTable(
+            section("strings.offsets"),
+            section("strings.data"),
+            section("strings.sorted"),
+        )
+        self._roots = header["roots"]
+        self._trees_names = header["trees"]
+        self._trees = dict()
+        for name in self._trees_names:
+            self._trees[name] = CompactTree.from_arrays(
+                self.strings,
+                keys_ids=section(f"{name}.keys"),
+                parents=section(f"{name}.parents"),
+                names=section(f"{name}.names"),
+                weights=section(f"{name}.weights"),
+                leaves=section(f"{name}.leaves"),
+                offsets={
+                    attr: section(f"{name}.{attr}.offsets") for attr in _LISTS
+                },
+                values_ids={
+                    attr: section(f"{name}.{attr}") for attr in _LISTS
+                },
+                node_ids=section(f"{name}.node_ids"),
+            )
+
+    def close(self):
+        if self._mmap is None:
+            return
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+        self._mmap = None
+
+    @property
+    def closed(self):
+        return self._mmap is None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def compact(self):
+        return self._trees
+
+    def vocabulary(self, unknown="unk"):
+        # Palavras presentes nos nomes dos nós (ver OntologyTrees.vocabulary)
+        from .embeddings import trees_vocabulary
+
+        return trees_vocabulary(self._trees, unknown)
+
+    def get_tree(self, hierarchy_name):
+        return self._trees.get(hierarchy_name)
+
+    def get_root(self, hierarchy_name):
+        return self._roots.get(hierarchy_name)
+
+    @property
+    def roots(self):
+        return self._roots
+
+    @property
+    def trees_names(self):
+        return self._trees_names
+
+    @property
+    def trees(self):
+        return self._trees
+
+
+def load_trees(filename):
+    return MappedOntologyTrees(filename)
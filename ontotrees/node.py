@@ -1,4 +1,21 @@
+# Listas com pelo menos esse número de elementos ganham um conjunto auxiliar
+# para verificar se um valor já foi adicionado em O(1).
+_MEMBERS_THRESHOLD = 16
+
+
 class Node:
+    __slots__ = (
+        "parent",
+        "data",
+        "name",
+        "children",
+        "weight",
+        "domains",
+        "ranges",
+        "is_leaf",
+        "_members",
+    )
+
     def __init__(self, data=None, parent=None, name=None):
         self.parent = parent
         self.data = data
@@ -11,16 +28,58 @@ class Node:
         self.ranges = []
 
         self.is_leaf = True
+        self._members = None
+
+    def __getstate__(self):
+        return {attr: getattr(self, attr) for attr in self.__slots__[:-1]}
+
+    def __setstate__(self, state):
+        # Aceita tanto o estado atual quanto o de nós serializados antes do
+        # uso de __slots__ (um dicionário com os atributos).
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **(state[1] or {})}
+        self._members = None
+        for attr, value in state.items():
+            setattr(self, attr, value)
+
+    def _has(self, attr, value):
+        values = getattr(self, attr)
+        if len(values) < _MEMBERS_THRESHOLD:
+            return value in values
+        if self._members is None:
+            self._members = dict()
+        # O conjunto é refeito se a lista tiver sido substituída ou alterada
+        # fora dos métodos add_*.
+        cached = self._members.get(attr)
+        if (
+            cached is None
+            or cached[0] is not values
+            or len(cached[1]) != len(values)
+        ):
+            cached = self._members[attr] = (values, set(values))
+        return value in cached[1]
+
+    def _add(self, attr, value):
+        getattr(self, attr).append(value)
+        if self._members and attr in self._members:
+            self._members[attr][1].add(value)
 
     def add_child(self, child: str):
-        if child not in self.children:
+        if not self._has("children", child):
             self.is_leaf = False
-            self.children.append(child)
+            self._add("children", child)
+
+    def remove_child(self, child: str):
+        if self._has("children", child):
+            self.children.remove(child)
+            if self._members and "children" in self._members:
+                self._members["children"][1].discard(child)
+            self.is_leaf = not self.children
 
     def add_domain(self, domain: str):
-        if domain not in self.domains:
-            self.domains.append(domain)
+        if not self._has("domains", domain):
+            self._add("domains", domain)
 
     def add_range(self, range: str):
-        if range not in self.ranges:
-            self.ranges.append(range)
+        if not self._has("ranges", range):
+            self._add("ranges", range)
@@ -1,19 +1,49 @@
-import rdflib
-from rdflib import URIRef, RDFS
 import configparser
+import multiprocessing
 import pathlib
 import os
+from functools import partial
 
 from .node import Node
+from .compact import compact_trees
+from .mapped import save_trees
+from .stream import (
+    collect_graph_schema,
+    collect_schema,
+    collect_schema_parallel,
+    read_schema_triples,
+    SchemaCollector,
+)
 
 _classes_sparql = "SELECT ?cls ?sup WHERE { ?cls a owl:Class . OPTIONAL{ ?cls rdfs:subClassOf ?sup . } FILTER(?cls != owl:Thing)}"
 _objects_sparql = "SELECT ?prop ?sup ?domain ?range WHERE { ?prop a owl:ObjectProperty . OPTIONAL{ ?prop rdfs:subPropertyOf ?sup .} OPTIONAL{ ?prop rdfs:domain ?domain. } OPTIONAL{ ?prop rdfs:range ?range. } FILTER(?prop != owl:topObjectProperty)}"
 _data_sparql = "SELECT ?prop ?sup ?domain ?range WHERE { ?prop a owl:DatatypeProperty . OPTIONAL{ ?prop rdfs:subPropertyOf ?sup . } OPTIONAL{?prop rdfs:domain ?domain.} OPTIONAL{ ?prop rdfs:range ?range.} FILTER(?prop != owl:topDataProperty)}"
 
+_HIERARCHIES_ROOTS = {
+    "classes": "http://www.w3.org/2002/07/owl#Thing",
+    "object_properties": "http://www.w3.org/2002/07/owl#topObjectProperty",
+    "data_properties": "http://www.w3.org/2002/07/owl#topDataProperty",
+}
+
 _ROOT = pathlib.Path(__file__).parent.parent.absolute()
 
+# Esquema compartilhado (via fork) com os processos que constroem as
+# hierarquias em load_ontology_parallel.
+_parallel_schema = None
+
+
+def _grow_hierarchy(lang, labels_filename, hierarchy_name):
+    onto_trees = OntologyTrees(lang, labels_filename)
+    return onto_trees._build_hierarchy(
+        _parallel_schema.get_labels,
+        hierarchy_name,
+        _parallel_schema.rows(hierarchy_name),
+    )
+
 
 def _get_rdfs_label(graph, subject, lang=None):
+    from rdflib import URIRef, RDFS
+
     subject = URIRef(subject)
     labels = []
     # setup the language filtering
@@ -42,18 +72,27 @@ def _get_rdfs_label(graph, subject, lang=None):
 class OntologyTrees:
     # Constrói três árvores, sendo elas (classes, object properties, data properties)
     # a partir de arquivo owl ou ttl no formato rdf
-    def __init__(self, lang=None):
+    def __init__(self, lang=None, labels_filename=None):
         self._roots = dict()
         self._trees = dict()
         self._max_depth = dict()
         self._trees_names = []
         self.lang = lang
-
+        # Esquema (tipos, superclasses, domains, ranges e labels) usado nas
+        # atualizações incrementais (ver apply_delta). Só é guardado com
+        # keep_schema=True ou load_schema e não é salvo no pickle.
+        self._schema = None
+
+        # Labels das propriedades (seção PROPERTIES), por padrão os do
+        # properties_labels.ini
+        if labels_filename is None:
+            labels_filename = os.path.join(_ROOT, "properties_labels.ini")
+        self.labels_filename = labels_filename
         config = configparser.ConfigParser(delimiters="=")
-        config.read(os.path.join(_ROOT, "properties_labels.ini"))
+        config.read(labels_filename)
         self.properties_text = config["PROPERTIES"]
 
-    def __grow_tree(self, graph, hierarchy_name, query_result):
+    def __grow_tree(self, get_labels, hierarchy_name, query_result):
         for row in query_result:
             node = Node(str(row[0]), str(row[1]))
             # Se o nó for de propriedades então busca o "label" no
@@ -67,10 +106,10 @@ class OntologyTrees:
                     node.add_range(str(row[3]))
             else:
                 # Se o nó for de classe, utiliza o rdfs label
-                names = _get_rdfs_label(graph, str(row[0]), self.lang)
+                names = get_labels(str(row[0]))
                 if names:
                     node.name = names[0]
-            self.__add_node(graph, hierarchy_name, node)
+            self.__add_node(get_labels, hierarchy_name, node)
 
     def load_ontology(
         self,
@@ -80,30 +119,278 @@ class OntologyTrees:
         location=None,
         file=None,
         data=None,
+        keep_schema=False,
         **args,
     ):
+        # O rdflib só é importado para construir as árvores, o que permite
+        # carregá-las (pickle) sem ele.
+        import rdflib
+
         # Carregar grafo
         graph = rdflib.Graph()
         graph.parse(source, publicID, format, location, file, data, **args)
 
-        self.__create_hierarchy("classes")
-        self._roots["classes"] = "http://www.w3.org/2002/07/owl#Thing"
-        qres = graph.query(_classes_sparql)
-        self.__grow_tree(graph, "classes", qres)
-
-        self.__create_hierarchy("object_properties")
-        self._roots[
-            "object_properties"
-        ] = "http://www.w3.org/2002/07/owl#topObjectProperty"
-        qres = graph.query(_objects_sparql)
-        self.__grow_tree(graph, "object_properties", qres)
-
-        self.__create_hierarchy("data_properties")
-        self._roots[
-            "data_properties"
-        ] = "http://www.w3.org/2002/07/owl#topDataProperty"
-        qres = graph.query(_data_sparql)
-        self.__grow_tree(graph, "data_properties", qres)
+        def get_labels(subject):
+            return _get_rdfs_label(graph, subject, self.lang)
+
+        if keep_schema:
+            self.__keep_schema(collect_graph_schema(graph, self.lang))
+
+        self.__build_trees(
+            get_labels,
+            {
+                "classes": graph.query(_classes_sparql),
+                "object_properties": graph.query(_objects_sparql),
+                "data_properties": graph.query(_data_sparql),
+            },
+        )
+
+    def load_ontology_stream(
+        self,
+        source,
+        format=None,
+        progress=None,
+        chunk_size=100000,
+        keep_schema=False,
+    ):
+        # Constrói as árvores lendo as triplas em sequência com o parser do
+        # rdflib, guardando apenas rdf:type, rdfs:subClassOf,
+        # rdfs:subPropertyOf, rdfs:domain, rdfs:range e rdfs:label, sem
+        # montar um rdflib.Graph (ver stream.read_triples). Só o N-Triples é
+        # lido linha a linha: o Turtle (e os demais formatos) ainda é lido
+        # inteiro pelo parser notation3 do rdflib antes de gerar as triplas.
+        # progress(stage, count) é chamado a cada chunk_size triplas lidas.
+        schema = collect_schema(
+            source, format, self.lang, progress, chunk_size
+        )
+        if keep_schema:
+            self.__keep_schema(schema)
+        self.__build_trees(
+            schema.get_labels,
+            {
+                hierarchy_name: schema.rows(hierarchy_name)
+                for hierarchy_name in _HIERARCHIES_ROOTS
+            },
+        )
+
+    def load_ontology_parallel(
+        self, sources, format=None, workers=None, keep_schema=False
+    ):
+        # Constrói as árvores a partir de vários arquivos (shards) da
+        # ontologia, lendo-os em paralelo e construindo as três hierarquias
+        # em processos separados. O resultado é o mesmo de
+        # load_ontology_stream sobre os arquivos concatenados.
+        global _parallel_schema
+        if isinstance(sources, (str, os.PathLike)):
+            sources = [sources]
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if (
+            workers <= 1
+            or "fork" not in multiprocessing.get_all_start_methods()
+        ):
+            schema = collect_schema_parallel(sources, format, self.lang)
+            if keep_schema:
+                self.__keep_schema(schema)
+            self.__build_trees(
+                schema.get_labels,
+                {name: schema.rows(name) for name in _HIERARCHIES_ROOTS},
+            )
+            return
+
+        context = multiprocessing.get_context("fork")
+        with context.Pool(min(workers, len(sources))) as pool:
+            schema = collect_schema_parallel(sources, format, self.lang, pool)
+        if keep_schema:
+            self.__keep_schema(schema)
+
+        # O pool das hierarquias é criado depois, para herdar o esquema
+        _parallel_schema = schema
+        try:
+            with context.Pool(min(workers, len(_HIERARCHIES_ROOTS))) as pool:
+                trees = pool.map(
+                    partial(_grow_hierarchy, self.lang, self.labels_filename),
+                    list(_HIERARCHIES_ROOTS),
+                )
+        finally:
+            _parallel_schema = None
+
+        for hierarchy_name, tree in zip(_HIERARCHIES_ROOTS, trees):
+            self.__create_hierarchy(hierarchy_name)
+            self._roots[hierarchy_name] = _HIERARCHIES_ROOTS[hierarchy_name]
+            self._trees[hierarchy_name] = tree
+
+    def load_schema(self, source, format=None):
+        # Lê apenas o esquema da ontologia (que deve ser a mesma usada na
+        # construção das árvores), permitindo atualizar com apply_delta
+        # árvores carregadas de um pickle.
+        self.__keep_schema(collect_schema(source, format, self.lang))
+
+    @property
+    def updatable(self):
+        # Pickles antigos não têm o atributo _schema
+        return getattr(self, "_schema", None) is not None
+
+    def __getstate__(self):
+        # O esquema pode ser maior que as próprias árvores, então não é
+        # salvo no pickle (ver load_schema)
+        state = self.__dict__.copy()
+        state["_schema"] = None
+        return state
+
+    def __keep_schema(self, schema):
+        # Novos labels podem chegar por atualizações de qualquer sujeito
+        schema.label_subjects = None
+        self._schema = schema
+
+    def apply_delta(self, added=(), removed=()):
+        # Aplica triplas adicionadas e removidas (sujeito, predicado, objeto)
+        # atualizando apenas os nós afetados, seus pais e filhos. Retorna,
+        # para cada hierarquia, as chaves dos nós alterados (incluindo os
+        # removidos e os que tiveram filhos adicionados ou removidos).
+        if not self.updatable:
+            raise ValueError(
+                "The trees were built without the ontology schema, use "
+                "load_schema, keep_schema=True or apply_diff."
+            )
+        schema = self._schema
+        added = [(str(s), str(p), o) for s, p, o in added]
+        removed = [(str(s), str(p), o) for s, p, o in removed]
+        subjects = dict.fromkeys(s for s, _, _ in removed + added)
+
+        before = self.__parents(schema, subjects)
+        for triple in removed:
+            schema.remove(*triple)
+        for triple in added:
+            schema.add(*triple)
+        return self.__update_trees(subjects, before)
+
+    def apply_diff(self, old_source, new_source, format=None):
+        # Aplica a diferença entre duas versões do arquivo da ontologia. O
+        # esquema passa a ser o da nova versão, mantendo a ordem do arquivo
+        # (a ordem dos domains, ranges e labels é a mesma de uma construção
+        # a partir dele).
+        old_triples = read_schema_triples(old_source, format)
+        new_triples = read_schema_triples(new_source, format)
+        subjects = dict.fromkeys(
+            triple[0]
+            for triples, others in (
+                (old_triples, new_triples),
+                (new_triples, old_triples),
+            )
+            for triple in triples
+            if triple not in others
+        )
+        old_schema, new_schema = (
+            SchemaCollector(self.lang),
+            SchemaCollector(self.lang),
+        )
+        for triple in old_triples:
+            old_schema.add(*triple)
+        for triple in new_triples:
+            new_schema.add(*triple)
+
+        before = self.__parents(old_schema, subjects)
+        self.__keep_schema(new_schema)
+        return self.__update_trees(subjects, before)
+
+    def __parents(self, schema, subjects):
+        return {
+            name: {uri: schema.parents(name, uri) for uri in subjects}
+            for name in self._trees_names
+            if name in _HIERARCHIES_ROOTS
+        }
+
+    def __update_trees(self, subjects, before):
+        changed = dict()
+        for name, parents in before.items():
+            changed[name] = self.__update_hierarchy(name, subjects, parents)
+            if changed[name]:
+                # A profundidade é recalculada quando for pedida novamente
+                self._max_depth.pop(name, None)
+        return changed
+
+    def __node_name(self, hierarchy_name, uri):
+        if "properties" in hierarchy_name:
+            if uri in self.properties_text:
+                return self.properties_text[uri]
+            return None
+        names = self._schema.get_labels(uri)
+        return names[0] if names else None
+
+    def __update_hierarchy(self, hierarchy_name, subjects, before):
+        tree = self._trees[hierarchy_name]
+        schema = self._schema
+        changed = set()
+
+        def prune(key):
+            # Pais que ficaram sem filhos e não pertencem à hierarquia
+            node = tree.get(key)
+            if (
+                node is not None
+                and not node.children
+                and key != self._roots[hierarchy_name]
+                and not schema.is_member(hierarchy_name, key)
+            ):
+                del tree[key]
+                changed.add(key)
+
+        for uri in subjects:
+            old_parents = before[uri]
+            new_parents = schema.parents(hierarchy_name, uri)
+            for parent in old_parents:
+                if parent not in new_parents and parent in tree:
+                    tree[parent].remove_child(uri)
+                    changed.add(parent)
+                    prune(parent)
+
+            name = self.__node_name(hierarchy_name, uri)
+            if new_parents:
+                node = tree.get(uri)
+                if node is None:
+                    node = tree[uri] = Node(uri)
+                # Como na construção, prevalece o último pai encontrado
+                node.parent = new_parents[-1]
+                node.name = name
+                if "properties" in hierarchy_name:
+                    node.domains = list(schema.domains.get(uri, ()))
+                    node.ranges = list(schema.ranges.get(uri, ()))
+                changed.add(uri)
+                for parent in new_parents:
+                    if parent not in old_parents:
+                        if parent not in tree:
+                            tree[parent] = Node(
+                                parent,
+                                name=self.__node_name(hierarchy_name, parent),
+                            )
+                        tree[parent].add_child(uri)
+                        changed.add(parent)
+            elif uri in tree:
+                node = tree[uri]
+                if old_parents:
+                    # Deixou de pertencer à hierarquia, mas pode continuar
+                    # como pai de outros nós
+                    node.parent = None
+                    node.domains = []
+                    node.ranges = []
+                    changed.add(uri)
+                if node.name != name:
+                    node.name = name
+                    changed.add(uri)
+                prune(uri)
+        return changed
+
+    def __build_trees(self, get_labels, rows):
+        for hierarchy_name in _HIERARCHIES_ROOTS:
+            self._build_hierarchy(
+                get_labels, hierarchy_name, rows[hierarchy_name]
+            )
+
+    def _build_hierarchy(self, get_labels, hierarchy_name, rows):
+        self.__create_hierarchy(hierarchy_name)
+        self._roots[hierarchy_name] = _HIERARCHIES_ROOTS[hierarchy_name]
+        self.__grow_tree(get_labels, hierarchy_name, rows)
+        return self._trees[hierarchy_name]
 
     def __get_max_depth(self, hierarchy_name, root):
         tree = self._trees[hierarchy_name]
@@ -136,7 +423,7 @@ class OntologyTrees:
         else:
             print("A hierarchy with that name has already been created.")
 
-    def __add_node(self, graph, hierarchy_name, node):
+    def __add_node(self, get_labels, hierarchy_name, node):
         if hierarchy_name in self._trees:
             # Add / Update node in the tree
             if node.data not in self._trees[hierarchy_name]:
@@ -157,7 +444,7 @@ class OntologyTrees:
                     if node.parent in self.properties_text:
                         parent_node.name = self.properties_text[node.parent]
                 else:
-                    names = _get_rdfs_label(graph, node.parent, self.lang)
+                    names = get_labels(node.parent)
                     if names:
                         parent_node.name = names[0]
 
@@ -169,6 +456,32 @@ class OntologyTrees:
         else:
             print("No hierarchy with that name has been created.")
 
+    def compact(self):
+        # Versão das árvores em arrays com ids inteiros (ver CompactTree)
+        return compact_trees(self._trees)
+
+    def save(self, filename):
+        # Salva as árvores no formato binário versionado (ver mapped.py),
+        # que pode ser aberto com load_trees sem ser desserializado.
+        save_trees(filename, self._trees, self._roots, self.lang)
+
+    def vocabulary(self, unknown="unk"):
+        # Palavras presentes nos nomes dos nós das três árvores
+        from .embeddings import trees_vocabulary
+
+        return trees_vocabulary(self._trees, unknown)
+
+    def export_embeddings(self, model_path, filename, unknown="unk"):
+        # Salva apenas os embeddings das palavras das árvores, para que a
+        # Recommendation não precise carregar o modelo completo.
+        from .embeddings import prune_word_vectors
+
+        word_vectors = prune_word_vectors(
+            model_path, filename, self.vocabulary(unknown)
+        )
+        print(f"Saving {len(word_vectors)} embeddings as {filename}")
+        return word_vectors
+
     def get_tree(self, hierarchy_name):
         if hierarchy_name in self._trees:
             return self._trees[hierarchy_name]
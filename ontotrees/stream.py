@@ -0,0 +1,276 @@
+import itertools
+import os
+
+_RDF = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+_RDFS = "http://www.w3.org/2000/01/rdf-schema#"
+_OWL = "http://www.w3.org/2002/07/owl#"
+
+_TYPE = _RDF + "type"
+_SUB_CLASS_OF = _RDFS + "subClassOf"
+_SUB_PROPERTY_OF = _RDFS + "subPropertyOf"
+_DOMAIN = _RDFS + "domain"
+_RANGE = _RDFS + "range"
+_LABEL = _RDFS + "label"
+
+# Tipo rdf -> (hierarquia, nó excluído das linhas, como nas consultas SPARQL)
+_HIERARCHIES = {
+    _OWL + "Class": ("classes", _OWL + "Thing"),
+    _OWL + "ObjectProperty": ("object_properties", _OWL + "topObjectProperty"),
+    _OWL + "DatatypeProperty": ("data_properties", _OWL + "topDataProperty"),
+}
+_SCHEMA_PREDICATES = {_TYPE, _SUB_CLASS_OF, _SUB_PROPERTY_OF, _DOMAIN, _RANGE}
+_EXCLUDED = {name: top for name, top in _HIERARCHIES.values()}
+
+
+def read_triples(
+    source, handle, format=None, predicates=None, progress=None, chunk=100000
+):
+    # Lê as triplas com o parser do rdflib, mas sem guardá-las em um grafo:
+    # cada tripla cujo predicado esteja em "predicates" é repassada para
+    # handle(subject, predicate, object). O parser do N-Triples lê o arquivo
+    # linha a linha; o do Turtle (notation3) lê o arquivo inteiro antes de
+    # gerar as triplas. progress(count) é chamado a cada "chunk" triplas
+    # lidas.
+    import rdflib
+
+    counter = itertools.count(1)
+
+    class _SinkGraph(rdflib.Graph):
+        def add(self, triple):
+            count = next(counter)
+            if progress and count % chunk == 0:
+                progress(count)
+            subject, predicate, obj = triple
+            predicate = str(predicate)
+            if predicates is None or predicate in predicates:
+                handle(str(subject), predicate, obj)
+            return self
+
+    _SinkGraph().parse(source, format=format)
+    return next(counter) - 1
+
+
+class SchemaCollector:
+    # Guarda, a partir das triplas lidas em sequência, apenas o necessário
+    # para construir as três árvores: tipos, superclasses/superpropriedades,
+    # domains, ranges e labels.
+    def __init__(self, lang=None):
+        self.lang = lang
+        # dicionários são usados como conjuntos ordenados
+        self.members = {name: dict() for name, _ in _HIERARCHIES.values()}
+        self.supers = dict()
+        self.domains = dict()
+        self.ranges = dict()
+        self.labels = dict()
+        self.label_subjects = None
+
+    def add(self, subject, predicate, obj):
+        if predicate == _TYPE:
+            hierarchy = _HIERARCHIES.get(str(obj))
+            if hierarchy:
+                self.members[hierarchy[0]][subject] = None
+        elif predicate == _SUB_CLASS_OF or predicate == _SUB_PROPERTY_OF:
+            self.supers.setdefault(subject, dict())[str(obj)] = None
+        elif predicate == _DOMAIN:
+            self.domains.setdefault(subject, dict())[str(obj)] = None
+        elif predicate == _RANGE:
+            self.ranges.setdefault(subject, dict())[str(obj)] = None
+        elif predicate == _LABEL:
+            self.add_label(subject, obj)
+
+    def remove(self, subject, predicate, obj):
+        # Desfaz o efeito de add, usado nas atualizações incrementais
+        if predicate == _TYPE:
+            hierarchy = _HIERARCHIES.get(str(obj))
+            if hierarchy:
+                self.members[hierarchy[0]].pop(subject, None)
+        elif predicate in (_SUB_CLASS_OF, _SUB_PROPERTY_OF, _DOMAIN, _RANGE):
+            values = {
+                _SUB_CLASS_OF: self.supers,
+                _SUB_PROPERTY_OF: self.supers,
+                _DOMAIN: self.domains,
+                _RANGE: self.ranges,
+            }[predicate]
+            objects = values.get(subject, {})
+            objects.pop(str(obj), None)
+            if not objects:
+                values.pop(subject, None)
+        elif predicate == _LABEL and self._accepts_label(obj):
+            labels = self.labels.get(subject, [])
+            if str(obj) in labels:
+                labels.remove(str(obj))
+            if not labels:
+                self.labels.pop(subject, None)
+
+    def _accepts_label(self, label):
+        language = getattr(label, "language", None)
+        if self.lang is not None:
+            if self.lang == "" and language is not None:
+                return False
+            if self.lang != "" and language != self.lang:
+                return False
+        return True
+
+    def add_label(self, subject, label):
+        if (
+            self.label_subjects is not None
+            and subject not in self.label_subjects
+        ):
+            return
+        if self._accepts_label(label):
+            self.labels.setdefault(subject, []).append(str(label))
+
+    def merge(self, other):
+        # Acrescenta o que foi lido por outro coletor (de outro arquivo)
+        for hierarchy_name, members in other.members.items():
+            self.members[hierarchy_name].update(members)
+        for attr in ("supers", "domains", "ranges"):
+            values = getattr(self, attr)
+            for subject, objects in getattr(other, attr).items():
+                values.setdefault(subject, dict()).update(objects)
+        for subject, labels in other.labels.items():
+            self.labels.setdefault(subject, []).extend(labels)
+
+    def get_labels(self, subject):
+        return self.labels.get(subject, [])
+
+    def subjects(self):
+        # Nós e pais que podem precisar de label
+        subjects = set()
+        for members in self.members.values():
+            subjects.update(members)
+        for supers in self.supers.values():
+            subjects.update(supers)
+        return subjects
+
+    def is_member(self, hierarchy_name, uri):
+        return (
+            uri in self.members[hierarchy_name]
+            and uri != _EXCLUDED[hierarchy_name]
+        )
+
+    def parents(self, hierarchy_name, uri):
+        # Pais do nó na árvore ("None" se não houver superclasse), ou uma
+        # lista vazia se o nó não pertencer à hierarquia
+        if not self.is_member(hierarchy_name, uri):
+            return []
+        return [str(sup) for sup in self.supers.get(uri, ())] or ["None"]
+
+    def rows(self, hierarchy_name):
+        # Gera as mesmas linhas das consultas SPARQL de load_ontology
+        for uri in self.members[hierarchy_name]:
+            if uri == _EXCLUDED[hierarchy_name]:
+                continue
+            supers = list(self.supers.get(uri, ())) or [None]
+            if hierarchy_name == "classes":
+                for sup in supers:
+                    yield (uri, sup)
+                continue
+            domains = list(self.domains.get(uri, ())) or [None]
+            ranges = list(self.ranges.get(uri, ())) or [None]
+            for sup, domain, range in itertools.product(
+                supers, domains, ranges
+            ):
+                yield (uri, sup, domain, range)
+
+
+def collect_schema(
+    source, format=None, lang=None, progress=None, chunk=100000
+):
+    # Se a fonte for um arquivo, ela é lida duas vezes: a primeira obtém a
+    # hierarquia e a segunda apenas os labels dos nós encontrados, mantendo
+    # a memória limitada ao tamanho do esquema.
+    collector = SchemaCollector(lang)
+    two_passes = isinstance(source, (str, os.PathLike))
+
+    def stage_progress(stage):
+        if progress is None:
+            return None
+        return lambda count: progress(stage, count)
+
+    predicates = set(_SCHEMA_PREDICATES)
+    if not two_passes:
+        predicates.add(_LABEL)
+    read_triples(
+        source,
+        collector.add,
+        format,
+        predicates,
+        stage_progress("schema"),
+        chunk,
+    )
+    if two_passes:
+        collector.label_subjects = collector.subjects()
+        read_triples(
+            source,
+            collector.add,
+            format,
+            {_LABEL},
+            stage_progress("labels"),
+            chunk,
+        )
+    return collector
+
+
+def _collect_shard(args):
+    source, format, lang, label_subjects = args
+    collector = SchemaCollector(lang)
+    if label_subjects is None:
+        read_triples(source, collector.add, format, _SCHEMA_PREDICATES)
+    else:
+        collector.label_subjects = label_subjects
+        read_triples(source, collector.add, format, {_LABEL})
+        collector.label_subjects = None
+    return collector
+
+
+def collect_schema_parallel(sources, format=None, lang=None, pool=None):
+    # Lê cada arquivo (shard) em um processo do pool. Os resultados são
+    # combinados na ordem dos arquivos, de forma que o esquema seja o mesmo
+    # da leitura sequencial dos arquivos concatenados.
+    map_function = pool.map if pool is not None else map
+    schema = SchemaCollector(lang)
+    for collector in map_function(
+        _collect_shard, [(source, format, lang, None) for source in sources]
+    ):
+        schema.merge(collector)
+
+    subjects = schema.subjects()
+    for collector in map_function(
+        _collect_shard,
+        [(source, format, lang, subjects) for source in sources],
+    ):
+        schema.merge(collector)
+    return schema
+
+
+def collect_graph_schema(graph, lang=None):
+    # Obtém o esquema de um rdflib.Graph já carregado, guardando apenas os
+    # labels dos nós e pais das hierarquias
+    collector = SchemaCollector(lang)
+    predicates = _SCHEMA_PREDICATES | {_LABEL}
+    for subject, predicate, obj in graph:
+        if str(predicate) in predicates:
+            collector.add(str(subject), str(predicate), obj)
+    subjects = collector.subjects()
+    collector.labels = {
+        subject: labels
+        for subject, labels in collector.labels.items()
+        if subject in subjects
+    }
+    return collector
+
+
+def read_schema_triples(source, format=None):
+    # Triplas do esquema (e labels) de um arquivo, na ordem em que aparecem.
+    # O dicionário é usado como um conjunto ordenado.
+    triples = dict()
+    read_triples(
+        source,
+        lambda subject, predicate, obj: triples.setdefault(
+            (subject, predicate, obj)
+        ),
+        format,
+        _SCHEMA_PREDICATES | {_LABEL},
+    )
+    return triples
@@ -0,0 +1,112 @@
+import threading
+import time
+
+_local = threading.local()
+
+# Limites (em segundos) do histograma de duração das chamadas
+_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def current_trace():
+    # Trace da chamada em andamento nesta thread (None se não houver)
+    return getattr(_local, "trace", None)
+
+
+class Trace:
+    # Tempo de cada etapa (em segundos, somado quando a etapa é executada
+    # mais de uma vez) e contagens de uma única chamada
+    def __init__(self):
+        self.times = dict()
+        self.counts = dict()
+        self.total = 0.0
+
+    def add_time(self, stage, seconds):
+        self.times[stage] = self.times.get(stage, 0.0) + seconds
+
+    def count(self, event, amount=1):
+        self.counts[event] = self.counts.get(event, 0) + amount
+
+    def as_dict(self):
+        return {
+            "total": self.total,
+            "times": dict(self.times),
+            "counts": dict(self.counts),
+        }
+
+    def __enter__(self):
+        self._previous = current_trace()
+        _local.trace = self
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.total = time.perf_counter() - self._start
+        _local.trace = self._previous
+        return False
+
+
+class Tracer:
+    # Recebe o Trace de cada chamada, repassando-o para o callback (se
+    # houver) e acumulando os totais exportados no formato texto do
+    # Prometheus.
+    def __init__(self, callback=None, prefix="ontoexplorer"):
+        self.callback = callback
+        self.prefix = prefix
+        self.calls = 0
+        self.seconds = 0.0
+        self.times = dict()
+        self.counts = dict()
+        self.buckets = [0] * len(_BUCKETS)
+        self._lock = threading.Lock()
+
+    def record(self, trace):
+        with self._lock:
+            self.calls += 1
+            self.seconds += trace.total
+            for stage, seconds in trace.times.items():
+                self.times[stage] = self.times.get(stage, 0.0) + seconds
+            for event, amount in trace.counts.items():
+                self.counts[event] = self.counts.get(event, 0) + amount
+            for index, bound in enumerate(_BUCKETS):
+                if trace.total <= bound:
+                    self.buckets[index] += 1
+        if self.callback is not None:
+            self.callback(trace.as_dict())
+
+    def hit_rate(self, cache="cache"):
+        hits = self.counts.get(f"{cache}_hits", 0)
+        total = hits + self.counts.get(f"{cache}_misses", 0)
+        return hits / total if total else 0.0
+
+    def prometheus(self):
+        name = self.prefix
+        lines = [
+            f"# TYPE {name}_request_seconds histogram",
+        ]
+        with self._lock:
+            for bound, count in zip(_BUCKETS, self.buckets):
+                lines.append(
+                    f'{name}_request_seconds_bucket{{le="{bound}"}} {count}'
+                )
+            lines.append(
+                f'{name}_request_seconds_bucket{{le="+Inf"}} {self.calls}'
+            )
+            lines.append(f"{name}_request_seconds_sum {self.seconds}")
+            lines.append(f"{name}_request_seconds_count {self.calls}")
+            lines.append(f"# TYPE {name}_stage_seconds_total counter")
+            for stage, seconds in sorted(self.times.items()):
+                lines.append(
+                    f'{name}_stage_seconds_total{{stage="{stage}"}} {seconds}'
+                )
+            lines.append(f"# TYPE {name}_events_total counter")
+            for event, amount in sorted(self.counts.items()):
+                lines.append(
+                    f'{name}_events_total{{event="{event}"}} {amount}'
+                )
+            lines.append(f"# TYPE {name}_cache_hit_ratio gauge")
+            for cache in ("cache", "search_cache"):
+                lines.append(
+                    f'{name}_cache_hit_ratio{{cache="{cache}"}} '
+                    f"{self.hit_rate(cache)}"
+                )
+        return "\n".join(lines) + "\n"
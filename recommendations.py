@@ -1,34 +1,198 @@
-from rdflib import URIRef, RDFS
-from rdflib import Graph
+import sys
+import time
+
+# O ontotrees pode já ter sido importado (pelo pacote), então o seu tempo
+# de importação é somado separadamente
+_ontotrees_imported = "ontotrees" in sys.modules
+_import_start = time.perf_counter()
+
+import contextlib
+import copy
+import itertools
 import random
 import pickle
 import configparser
 import pathlib
 import os
-import sys
-from unidecode import unidecode
-from gensim.models import KeyedVectors
+import multiprocessing
+import threading
+import weakref
+from collections import namedtuple
+
+# rdflib, numpy e gensim são importados apenas quando necessários (as
+# etapas graph_parse e embeddings_import da inicialização)
+import ontotrees
+from ontotrees import (
+    DomainRangeIndex,
+    HierarchyIndex,
+    LevelIndex,
+    LRUCache,
+    OntologyTrees,
+    Trace,
+    Tracer,
+    current_trace,
+    load_trees,
+)
+
+_IMPORT_TIME = time.perf_counter() - _import_start
+if _ontotrees_imported:
+    _IMPORT_TIME += ontotrees.IMPORT_TIME
 
 _ROOT = pathlib.Path(__file__).parent.absolute()
 
+# Parâmetros de uma recomendação, lidos do recommendation.ini e que podem
+# ser alterados a cada chamada de get_recommendations
+RecommendationParams = namedtuple(
+    "RecommendationParams",
+    [
+        "depth",
+        "family_position",
+        "filter_by",
+        "order",
+        "order_set",
+        "size",
+        "text",
+        "suggestion_text",
+        "similarity_threshold",
+        "neighbors",
+    ],
+)
 
-class Recommendation:
-    def __init__(self):
-        onto_trees = pickle.load(
-            open(os.path.join(_ROOT, "ontology_trees.pkl"), "rb")
+# Métodos substituídos na instância enquanto o tracing está ativo (ver
+# Recommendation.enable_tracing)
+_TRACED_METHODS = (
+    "get_recommendations",
+    "entities_that_can_be_exchanged",
+    "_search_nodes",
+    "_has_ancestor_in",
+    "_is_descendent_of",
+    "_order_and_filter_by_similarity",
+    "_format_recommendations",
+)
+
+
+def _traced_nodes(trace, nodes):
+    # Repassa os nós de uma busca (que pode ser lazy), somando o tempo
+    # gasto em cada passo à etapa "search" e contando os nós visitados
+    iterator = iter(nodes)
+    while True:
+        start = time.perf_counter()
+        try:
+            node = next(iterator)
+        except StopIteration:
+            trace.add_time("search", time.perf_counter() - start)
+            return
+        trace.add_time("search", time.perf_counter() - start)
+        trace.count("nodes_visited")
+        yield node
+
+
+# Instância compartilhada com os processos do get_recommendations_batch,
+# herdada via fork sem precisar ser serializada.
+_batch_recommendation = None
+
+
+def open_trees(
+    trees_path, ontology_path=None, ontology_format=None, labels_path=None
+):
+    # Abre as árvores de trees_path: arquivos .pkl são desserializados e os
+    # demais são abertos com mmap no formato binário (ver
+    # ontotrees/mapped.py). Retorna as árvores e o nome da etapa (ver
+    # Recommendation.startup_times).
+    if (
+        not os.path.exists(trees_path)
+        and ontology_path
+        and os.path.isfile(ontology_path)
+    ):
+        # Sem o arquivo das árvores, elas são construídas a partir da
+        # ontologia, com os labels do labels_path
+        onto_trees = OntologyTrees(labels_filename=labels_path)
+        onto_trees.load_ontology_stream(ontology_path, format=ontology_format)
+        print(
+            f"{trees_path} not found, the trees were built from "
+            f"{ontology_path} (save them with OntologyTrees.save)."
         )
+        return onto_trees, "trees_build"
+    if trees_path.endswith(".pkl"):
+        return pickle.load(open(trees_path, "rb")), "pickle_load"
+    return load_trees(trees_path), "trees_mmap"
+
 
+def _batch_worker(question_triples):
+    return _batch_recommendation.get_recommendations(question_triples)
+
+
+class Recommendation:
+    def __init__(self, previous=None, config_path=None, embedding_store=None):
+        # Tempo (em segundos) de cada etapa da inicialização
+        self.startup_times = {"imports": _IMPORT_TIME}
+        init_start = start = time.perf_counter()
+
+        if config_path is None:
+            config_path = os.path.join(_ROOT, "recommendation.ini")
+        self.config_path = config_path
         config = configparser.ConfigParser(delimiters="=")
-        config.read(os.path.join(_ROOT, "recommendation.ini"))
+        config.read(self.config_path)
         settings = config["DEFAULT"]
+        # Caminhos relativos são resolvidos a partir do diretório do
+        # arquivo de configuração
+        base = os.path.dirname(os.path.abspath(config_path))
+        ontology_path = os.path.join(
+            base, settings.get("ontology_filename", fallback="")
+        )
 
-        ontology_path = os.path.join(_ROOT, settings["ontology_filename"])
+        # Arquivos .pkl são desserializados; os demais são abertos com mmap
+        # no formato binário das árvores (ver ontotrees/mapped.py).
+        trees_path = os.path.join(
+            base,
+            settings.get("trees_filename", fallback="ontology_trees.pkl"),
+        )
+        self.trees_path = trees_path
+        self._ontology_path = ontology_path
+        self._ontology_format = settings.get("ontology_format")
+        self._labels_path = os.path.join(
+            base,
+            settings.get("labels_filename", fallback="properties_labels.ini"),
+        )
+        onto_trees, stage = self._open_trees()
+        start = self._elapsed(stage, start)
 
-        self.graph = Graph()
-        self.graph.parse(ontology_path, format=settings["ontology_format"])
+        # A hierarquia de classes já está nas árvores (e nos índices), então
+        # o grafo (atributo graph) é carregado apenas no primeiro acesso, ou
+        # na inicialização com load_graph=yes. A lista é compartilhada com
+        # as variantes (ver with_params).
+        self._graph = [None]
+        self._graph_lock = threading.Lock()
+        if settings.getboolean("load_graph", fallback=False):
+            self.graph
+            start = self._elapsed("graph_parse", start)
 
-        self.trees = onto_trees.trees
+        self.onto_trees = onto_trees
+        if settings.getboolean("compact_trees", fallback=False):
+            self.trees = onto_trees.compact()
+            if hasattr(onto_trees, "apply_delta"):
+                # As árvores em dicionários só são usadas nas atualizações e
+                # são carregadas novamente na primeira delas (ver
+                # _updatable_trees)
+                self.onto_trees = None
+        else:
+            self.trees = onto_trees.trees
         self.roots = onto_trees.roots
+        # Árvores abertas com mmap são liberadas em close, depois das
+        # perguntas em andamento (o contador e o lock são compartilhados com
+        # as variantes)
+        self._usage = None
+        if hasattr(onto_trees, "close"):
+            self._usage = [0, False]
+            self._usage_lock = threading.Lock()
+        # Os índices são construídos na primeira consulta a cada árvore, de
+        # forma que a inicialização (por exemplo, com árvores mapeadas) não
+        # percorra todos os nós: de ancestrais (ver _hierarchy_index),
+        # invertidos classe -> propriedades pelo domain e pelo range (ver
+        # _property_index) e de níveis (ver _levels).
+        self.indexes = dict()
+        self.property_indexes = dict()
+        self._level_indexes = dict()
 
         self.depth = settings.getint("depth")
         self.family_position = settings.getint("family_position")
@@ -39,43 +203,294 @@ class Recommendation:
         self.text = settings.get("rec_text")
         self.suggestion_text = settings.get("suggestion_text")
         model_path = settings.get("model_path")
+        embeddings_path = settings.get("embeddings_path")
+        if embeddings_path:
+            # Apenas os embeddings das palavras das árvores
+            model_path = os.path.join(base, embeddings_path)
+        self.model_path = model_path
+        # Modelos compartilhados com outras instâncias (ver EmbeddingStore)
+        self.embedding_store = embedding_store
+        self._similarity_threshold = settings.getfloat(
+            "similarity_threshold", fallback=-1.0
+        )
+        # Sugestões extras vindas dos nós mais similares de toda a árvore,
+        # fora da vizinhança da busca (ver _add_neighbors)
+        self.neighbors = settings.getint("neighbors", fallback=0)
+        self.neighbors_index = settings.get(
+            "neighbors_index", fallback="exact"
+        )
+        self._neighbor_indexes = dict()
+        self._embeddings_lock = threading.RLock()
+        # Função aplicada aos NodeEmbeddings carregados (ver wrap_embeddings)
+        self._embeddings_wrapper = None
+        # NodeEmbeddings, calculados na primeira consulta (a lista é
+        # compartilhada com as variantes)
+        self._node_embeddings = [None]
         if model_path and self.order=="semantic":
-            self.similarity_threshold = settings.getfloat(
-                "similarity_threshold"
-            )
-            self.embeddings = KeyedVectors.load_word2vec_format(
-                model_path, binary=False, unicode_errors="ignore"
+            self.similarity_threshold = self._similarity_threshold
+        if model_path and (self.order == "semantic" or self.neighbors > 0):
+            start = self._load_embeddings(previous, start)
+
+        # Cache das respostas (por formato de pergunta) e das buscas na árvore
+        cache_size = settings.getint("cache_size", fallback=0)
+        cache_ttl = settings.get("cache_ttl", fallback="")
+        cache_ttl = float(cache_ttl) if cache_ttl else None
+        self.cache = LRUCache(cache_size, cache_ttl)
+        self.search_cache = LRUCache(cache_size)
+
+        # Instâncias com outros parâmetros (ver with_params)
+        self._variants = LRUCache(64)
+        self.tracer = None
+
+        # Tabelas de recomendações pré-calculadas (ver build_tables)
+        self.tables = None
+        self.tables_config = None
+        tables_filename = settings.get("tables_filename", fallback="")
+        if tables_filename:
+            tables_path = os.path.join(base, tables_filename)
+            if os.path.exists(tables_path):
+                self.load_tables(tables_path)
+                start = self._elapsed("tables_load", start)
+
+        self.startup_times["total"] = time.perf_counter() - init_start
+        if settings.getboolean("startup_report", fallback=False):
+            print(self.startup_report())
+
+    def _open_trees(self):
+        return open_trees(
+            self.trees_path,
+            self._ontology_path,
+            self._ontology_format,
+            self._labels_path,
+        )
+
+    @property
+    def graph(self):
+        with self._graph_lock:
+            if self._graph[0] is None:
+                from rdflib import Graph
+
+                graph = Graph()
+                graph.parse(self._ontology_path, format=self._ontology_format)
+                self._graph[0] = graph
+        return self._graph[0]
+
+    @graph.setter
+    def graph(self, graph):
+        self._graph[0] = graph
+
+    def _load_embeddings(self, previous=None, start=None):
+        if start is None:
+            start = time.perf_counter()
+        from ontotrees import load_word_vectors
+
+        start = self._elapsed("embeddings_import", start)
+        # Em um reload, os embeddings da instância anterior são
+        # reaproveitados se o modelo for o mesmo.
+        if self.embedding_store is not None:
+            self.embeddings = self.embedding_store.get(self.model_path)
+            start = self._elapsed("embeddings_store", start)
+        elif (
+            getattr(previous, "model_path", None) == self.model_path
+            and getattr(previous, "embeddings", None) is not None
+        ):
+            self.embeddings = previous.embeddings
+            start = self._elapsed("embeddings_reuse", start)
+        else:
+            self.embeddings = load_word_vectors(self.model_path)
+            start = self._elapsed("embeddings_load", start)
+        return start
+
+    @property
+    def node_embeddings(self):
+        # Os embeddings dos nós são calculados na primeira ordenação
+        # semântica (ou busca de vizinhos), e não na inicialização
+        if self._node_embeddings[0] is None:
+            from ontotrees import NodeEmbeddings
+
+            with self._embeddings_lock:
+                if self._node_embeddings[0] is None:
+                    node_embeddings = NodeEmbeddings(
+                        self.embeddings, self.trees
+                    )
+                    if self._embeddings_wrapper is not None:
+                        node_embeddings = self._embeddings_wrapper(
+                            node_embeddings
+                        )
+                    self._node_embeddings[0] = node_embeddings
+        return self._node_embeddings[0]
+
+    @node_embeddings.setter
+    def node_embeddings(self, node_embeddings):
+        self._node_embeddings[0] = node_embeddings
+
+    def wrap_embeddings(self, wrapper):
+        # Substitui os NodeEmbeddings (os atuais e os calculados depois) por
+        # wrapper(node_embeddings), por exemplo um SimilarityBatcher. As
+        # variantes existentes são descartadas, então deve ser chamado antes
+        # de a instância começar a responder perguntas.
+        with self._embeddings_lock:
+            self._embeddings_wrapper = wrapper
+            if self._node_embeddings[0] is not None:
+                self._node_embeddings[0] = wrapper(self._node_embeddings[0])
+            self._variants.clear()
+
+    @property
+    def params(self):
+        return RecommendationParams(
+            self.depth,
+            self.family_position,
+            self.filter_by,
+            self.order,
+            self.order_set,
+            self.size,
+            self.text,
+            self.suggestion_text,
+            getattr(self, "similarity_threshold", None),
+            self.neighbors,
+        )
+
+    def with_params(self, params):
+        # Retorna uma Recommendation com os parâmetros informados que
+        # compartilha árvores, índices, embeddings e caches com esta
+        # instância (as chaves dos caches incluem os parâmetros). params
+        # pode ser um RecommendationParams ou um dicionário com os valores
+        # a serem alterados.
+        if params is None:
+            return self
+        if isinstance(params, dict):
+            params = self.params._replace(**params)
+        if params.order == "semantic" and params.similarity_threshold is None:
+            params = params._replace(
+                similarity_threshold=self._similarity_threshold
             )
+        if params == self.params:
+            return self
+        variant = self._variants.get(params)
+        if variant is None:
+            if params.order == "semantic" or params.neighbors > 0:
+                if not self.model_path:
+                    raise ValueError(
+                        "The semantic order and the neighbors need a "
+                        "model_path."
+                    )
+                # Os embeddings são carregados uma única vez e compartilhados
+                with self._embeddings_lock:
+                    if getattr(self, "embeddings", None) is None:
+                        self._load_embeddings()
+            variant = copy.copy(self)
+            for field, value in zip(params._fields, params):
+                setattr(variant, field, value)
+            if self.tracer is not None:
+                variant._install_tracing(self.tracer)
+            self._variants.put(params, variant)
+        return variant
+
+    def _elapsed(self, stage, start):
+        now = time.perf_counter()
+        self.startup_times[stage] = now - start
+        return now
+
+    def startup_report(self):
+        lines = ["Recommendation startup:"]
+        for stage, seconds in self.startup_times.items():
+            lines.append(f"  {stage:<16} {seconds * 1000:10.1f} ms")
+        return "\n".join(lines)
 
-    def _order_and_filter_by_similarity(self, source, targets):
-        # calcular a similaridade entre os embeddings da palavra a ser
-        # substituída com as candidatas.
-        distances = []
-        source_text = unidecode(source.name.lower()).split()
-        e1 = [i if i in self.embeddings else "unk" for i in source_text]
-        for node in targets:
-            target_text = unidecode(node.name.lower()).split()
-            e2 = [i if i in self.embeddings else "unk" for i in target_text]
-            distances.append(self.embeddings.n_similarity(e1, e2))
-
-        # Ordena do maior para o menor com base na similaridade
-        suggestions = [
-            targets[index]
-            for index, distance in sorted(
-                enumerate(distances), key=lambda x: x[1], reverse=True
+    def _order_and_filter_by_similarity(self, source, targets, limit=None):
+        # Ordena do maior para o menor com base na similaridade entre os
+        # embeddings da palavra a ser substituída e das candidatas. Apenas
+        # os "limit" mais similares são ordenados (seleção parcial).
+        return self.node_embeddings.rank(
+            source,
+            targets,
+            self.similarity_threshold,
+            self.size if limit is None else limit,
+        )
+
+    def _neighbor_index(self, key_tree):
+        # Construído na primeira consulta de cada árvore e compartilhado com
+        # as variantes
+        index = self._neighbor_indexes.get(key_tree)
+        if index is None:
+            from ontotrees import NeighborIndex
+
+            with self._embeddings_lock:
+                index = self._neighbor_indexes.get(key_tree)
+                if index is None:
+                    index = NeighborIndex(
+                        self.node_embeddings,
+                        list(self.trees[key_tree]),
+                        approximate=self.neighbors_index == "approximate",
+                    )
+                    self._neighbor_indexes[key_tree] = index
+        return index
+
+    def _add_neighbors(self, source, key_tree, related, accepts, limit=None):
+        # Acrescenta até "neighbors" nós da árvore, do mais para o menos
+        # similar a source, que ainda não estejam em related e que
+        # satisfaçam o mesmo filtro de domain/range (accepts)
+        if self.neighbors <= 0 or source is None:
+            return
+        present = {node.data for node in related}
+        present.add(source.data)
+        tree = self.trees[key_tree]
+        added = 0
+        for key in self._neighbor_index(key_tree).iter_neighbors(source.data):
+            if added >= self.neighbors or (
+                limit is not None and len(related) >= limit
+            ):
+                break
+            if key in present or key not in tree:
+                continue
+            node = tree[key]
+            if accepts(node):
+                present.add(key)
+                related.append(node)
+                added += 1
+
+    def _hierarchy_index(self, key_tree):
+        index = self.indexes.get(key_tree)
+        if index is None:
+            index = HierarchyIndex(self.trees[key_tree])
+            self.indexes[key_tree] = index
+        return index
+
+    def _property_index(self, prop_tree):
+        index = self.property_indexes.get(prop_tree)
+        if index is None:
+            index = DomainRangeIndex(
+                self.trees[prop_tree], self._hierarchy_index("classes")
             )
-            if distance >= self.similarity_threshold
-        ]
-        return suggestions
+            self.property_indexes[prop_tree] = index
+        return index
+
+    def _levels(self, key_tree):
+        index = self._level_indexes.get(key_tree)
+        if index is None:
+            index = LevelIndex(self.trees[key_tree])
+            self._level_indexes[key_tree] = index
+        return index
+
+    def warm(self):
+        # Constrói de uma vez os índices e os embeddings dos nós que seriam
+        # construídos nas primeiras perguntas (ver ReloadableRecommendation)
+        for key_tree in self.trees:
+            self._hierarchy_index(key_tree)
+            self._levels(key_tree)
+        for prop_tree in ("object_properties", "data_properties"):
+            self._property_index(prop_tree)
+        if getattr(self, "embeddings", None) is not None:
+            self.node_embeddings
+            if self.neighbors > 0:
+                for key_tree in self.trees:
+                    self._neighbor_index(key_tree)
+        return self
 
     def _get_ascedent(self, level, node, key_tree, root):
-        if level == 0:
-            return node
-        if root == node.data:
-            return node
-        return self._get_ascedent(
-            level + 1, self.trees[key_tree][node.parent], key_tree, root
-        )
+        # Sobe -level níveis a partir de node, parando em root
+        key = self._levels(key_tree).ancestor(node.data, -level, root)
+        return self.trees[key_tree][key]
 
     def _get_reference_node(self, node, key_tree, root):
         if self.family_position < 0:
@@ -86,43 +501,62 @@ class Recommendation:
             ref_node = node
         return ref_node
 
-    def _get_given_level(self, nodes, ignore_node, root, level, key_tree):
-        if root.data not in self.trees[key_tree]:
-            return root
-        if level == 1:
-            if root != ignore_node:
-                nodes.append(root)
-        elif level > 1:
-            for child_key in root.children:
-                self._get_given_level(
-                    nodes,
-                    ignore_node,
-                    self.trees[key_tree][child_key],
-                    level - 1,
-                    key_tree,
+    def _iter_level_order(self, ignore_node, node, level, key_tree):
+        # Nós dos níveis 1..level a partir do nó de referência, na ordem da
+        # busca em largura, consultados no índice de níveis.
+        tree = self.trees[key_tree]
+        if node.data not in tree:
+            return
+        levels = self._levels(key_tree)
+        if levels.available:
+            ignore = None if ignore_node is None else ignore_node.data
+            for key in levels.descendants(node.data, level):
+                if key != ignore:
+                    yield tree[key]
+            return
+        # Busca em largura, para árvores em que a herança múltipla deixaria
+        # o índice grande demais
+        current = [node]
+        for _ in range(level):
+            next_level = []
+            for item in current:
+                if item != ignore_node:
+                    yield item
+                next_level.extend(
+                    tree[child_key]
+                    for child_key in item.children
+                    if child_key in tree
                 )
-
-    def _get_level_order(self, ignore_node, node, level, key_tree):
-        nodes = []
-        ignore_node = ignore_node
-        for i in range(1, level + 1):
-            self._get_given_level(nodes, ignore_node, node, i, key_tree)
-        return nodes
+            current = next_level
 
     def _search_nodes(self, node_key, key_tree, root):
         node = self.trees[key_tree][node_key]
-        ref_node = self._get_reference_node(node, key_tree, root)
-        nodes = self._get_level_order(node, ref_node, self.depth, key_tree)
+        if self.search_cache.maxsize <= 0:
+            ref_node = self._get_reference_node(node, key_tree, root)
+            return self._iter_level_order(node, ref_node, self.depth, key_tree)
+        # O resultado depende apenas da árvore e da configuração da busca
+        key = (node_key, key_tree, root, self.depth, self.family_position)
+        nodes = self.search_cache.get(key)
+        if nodes is None:
+            ref_node = self._get_reference_node(node, key_tree, root)
+            nodes = tuple(
+                self._iter_level_order(node, ref_node, self.depth, key_tree)
+            )
+            self.search_cache.put(key, nodes)
         return nodes
 
+    def _must_reorder(self, order_set):
+        # Se a lista for reordenada, todos os candidatos são necessários;
+        # caso contrário a busca pode parar ao atingir o limite.
+        return self.order_set in (order_set, "all") and self.order in (
+            "random",
+            "semantic",
+        )
+
     def _is_descendent_of(self, classe, super_classe):
-        for subject in self.graph.subjects(
-            predicate=RDFS.subClassOf, object=URIRef(super_classe)
-        ):
-            subject = str(subject)
-            if subject == classe or self._is_descendent_of(classe, subject):
-                return True
-        return False
+        return self._hierarchy_index("classes").is_descendant(
+            classe, super_classe
+        )
 
     def _has_ancestor_in(self, ref, candidates):
         has_acenstor = False
@@ -135,52 +569,23 @@ class Recommendation:
         else:
             return None
 
-    def _has_intersection(self, group_1, group_2):
-        has_intersection = True
-        for elm in group_1:
-            if elm not in group_2:
-                has_intersection = False
-                break
-        return has_intersection
-
-    def _add_related_properties(
-        self, class_uri, node_ref, node_list, related, list_ref="domain"
-    ):
-        node_list_ref = {
-            "domain": node_ref.domains,
-            "range": node_ref.ranges,
-        }
-
-        if class_uri:
-            if class_uri in node_list_ref[list_ref]:
-                related.append(node_ref)
-            else:
-                ancestor = self._has_ancestor_in(
-                    class_uri, node_list_ref[list_ref]
-                )
-                if ancestor:
-                    related.append(node_ref)
-        else:
-            check_domain = self._has_intersection(
-                node_list_ref[list_ref], node_list_ref[list_ref]
-            )
-            if check_domain:
-                related.append(node_ref)
-
     def _add_related_classes(
-        self, class_uri, node_ref, related, list_ref="domain"
+        self, class_uri, node_ref, related, list_ref="domain", limit=None
     ):
         node_list_ref = {
             "domain": node_ref.domains,
             "range": node_ref.ranges,
         }
+        members = set(node_list_ref[list_ref])
         # Obter nós relacionados a classe
-        if class_uri in node_list_ref[list_ref]:
+        if class_uri in members:
             nodes = self._search_nodes(
                 class_uri, "classes", self.roots["classes"]
             )
             for node in nodes:
-                if node.data in node_list_ref[list_ref]:
+                if limit is not None and len(related) >= limit:
+                    break
+                if node.data in members:
                     related.append(node)
         else:
             ancestor = self._has_ancestor_in(
@@ -190,8 +595,21 @@ class Recommendation:
                 # obter relacionados ao nó class_uri que sejam descendentes de ancestor
                 nodes = self._search_nodes(class_uri, "classes", ancestor)
                 for node in nodes:
+                    if limit is not None and len(related) >= limit:
+                        break
                     if node.data != ancestor:
                         related.append(node)
+        if self.neighbors > 0 and class_uri in self.trees["classes"]:
+            # Classes similares em outros ramos, desde que sejam (ou
+            # descendam de) alguma classe do domain/range
+            self._add_neighbors(
+                self.trees["classes"][class_uri],
+                "classes",
+                related,
+                lambda node: node.data in members
+                or self._has_ancestor_in(node.data, members),
+                limit,
+            )
 
     def _get_related_properties(
         self,
@@ -199,49 +617,85 @@ class Recommendation:
         prop_tree="object_properties",
         domain_uri=None,
         range_uri=None,
+        limit=None,
     ):
+        # limit é o número de recomendações que ainda faltam (por padrão,
+        # number_of_recommendations)
+        limit = self.size if limit is None else limit
+        use_domain, use_range = self._property_filters(prop_tree)
+        related = self._lookup_table(
+            (
+                "properties",
+                prop_tree,
+                node_key,
+                domain_uri if use_domain else None,
+                range_uri if use_range else None,
+            ),
+            prop_tree,
+            limit,
+        )
+        if related is not None:
+            return related
+
         related = []
         if node_key in self.trees[prop_tree]:
             nodes = self._search_nodes(
                 node_key, prop_tree, self.roots[prop_tree]
             )
-            nodes_domains = self.trees[prop_tree][node_key].domains
-            nodes_ranges = self.trees[prop_tree][node_key].ranges
-            for node in nodes:
-                if (
-                    node not in related
-                    and (
-                        self.filter_by == "domain"
-                        or self.filter_by == "both"
-                        or prop_tree == "data_properties"
-                    )
+            index = self._property_index(prop_tree)
+            # Propriedades cujo domain/range cobre a classe da pergunta
+            domain_props = index.properties(domain_uri, "domain")
+            range_props = index.properties(range_uri, "range")
+            reorder = self._must_reorder("property")
+
+            def accepts(node):
+                return (
+                    use_domain
                     and node.domains
-                ):
-                    # Obter propriedades relacionadas com base no domain
-                    self._add_related_properties(
-                        domain_uri, node, nodes_domains, related, "domain"
-                    )
-                if (
-                    node not in related
-                    and (self.filter_by == "range" or self.filter_by == "both")
-                    and (node.ranges and prop_tree != "data_properties")
-                ):
-                    # Obter propriedades relacionadas com base no range
-                    self._add_related_properties(
-                        range_uri, node, nodes_ranges, related, "range"
-                    )
+                    and (not domain_uri or node.data in domain_props)
+                ) or (
+                    use_range
+                    and node.ranges
+                    and (not range_uri or node.data in range_props)
+                )
+
+            added = set()
+            for node in nodes:
+                if not reorder and len(related) >= limit:
+                    break
+                if node in added:
+                    continue
+                if accepts(node):
+                    added.add(node)
+                    related.append(node)
+            self._add_neighbors(
+                self.trees[prop_tree][node_key],
+                prop_tree,
+                related,
+                accepts,
+                None if reorder else limit,
+            )
 
-            if self.order_set == "property" or self.order_set == "all":
+            if reorder:
                 if self.order == "random":
                     random.shuffle(related)
                 elif self.order == "semantic":
                     related = self._order_and_filter_by_similarity(
-                        self.trees[prop_tree][node_key], related
+                        self.trees[prop_tree][node_key], related, limit
                     )
 
-        return related
+        return related[:limit]
+
+    def _get_related_classes(
+        self, node_key, domain_uri=None, range_uri=None, limit=None
+    ):
+        limit = self.size if limit is None else limit
+        related = self._lookup_table(
+            ("classes", node_key, domain_uri, range_uri), "classes", limit
+        )
+        if related is not None:
+            return related
 
-    def _get_related_classes(self, node_key, domain_uri=None, range_uri=None):
         node = None
         related = []
         if node_key in self.trees["object_properties"]:
@@ -250,22 +704,26 @@ class Recommendation:
         elif node_key in self.trees["data_properties"]:
             node = self.trees["data_properties"][node_key]
             prop_tree = "data_properties"
-        if node and node not in related:
+        if node:
+            reorder = self._must_reorder("class")
+            search_limit = None if reorder else limit
             if (
                 self.filter_by == "domain" or self.filter_by == "both"
             ) and node.domains:
                 # Obter classes relacionadas com base no domain
-                self._add_related_classes(domain_uri, node, related, "domain")
+                self._add_related_classes(
+                    domain_uri, node, related, "domain", search_limit
+                )
             if prop_tree != "data_properties":
                 if (
                     self.filter_by == "range" or self.filter_by == "both"
                 ) and node.ranges:
                     # Obter classes relacionadas com base no range
                     self._add_related_classes(
-                        range_uri, node, related, "range"
+                        range_uri, node, related, "range", search_limit
                     )
 
-            if self.order_set == "class" or self.order_set == "all":
+            if reorder:
                 if self.order == "random":
                     random.shuffle(related)
                 elif self.order == "semantic":
@@ -274,10 +732,177 @@ class Recommendation:
                     if range_uri:
                         class_node = self.trees["classes"][range_uri]
                     related = self._order_and_filter_by_similarity(
-                        class_node, related
+                        class_node, related, limit
+                    )
+
+        return related[:limit]
+
+    def _property_filters(self, prop_tree):
+        # Se o domain e o range da pergunta são considerados
+        use_domain = (
+            self.filter_by == "domain"
+            or self.filter_by == "both"
+            or prop_tree == "data_properties"
+        )
+        use_range = (
+            self.filter_by == "range" or self.filter_by == "both"
+        ) and prop_tree != "data_properties"
+        return use_domain, use_range
+
+    def _lookup_table(self, key, key_tree, limit):
+        # As tabelas só valem para a configuração com que foram geradas e
+        # guardam as listas completas, que são truncadas em limit
+        if self.tables is None or self.tables_config != self._tables_config():
+            return None
+        keys = self.tables.get(key)
+        if keys is None:
+            return None
+        tree = self.trees[key_tree]
+        try:
+            return [tree[item] for item in keys[:limit]]
+        except KeyError:
+            # Nó que não existe mais nas árvores
+            return None
+
+    def _tables_config(self):
+        # O tamanho e os textos das sugestões não alteram as tabelas
+        return self.params._replace(size=None, text=None, suggestion_text=None)
+
+    def _tables_fingerprint(self):
+        # Tamanho e data de modificação dos arquivos usados nas tabelas: o
+        # das árvores (ou o da ontologia, se as árvores foram construídas a
+        # partir dela) e o modelo de embeddings, se for usado
+        paths = [self.trees_path]
+        if not os.path.exists(self.trees_path):
+            paths = [self._ontology_path]
+        if self.model_path and (self.order == "semantic" or self.neighbors):
+            paths.append(self.model_path)
+        fingerprint = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                fingerprint.append((path, None))
+            else:
+                fingerprint.append((path, stat.st_size, stat.st_mtime_ns))
+        return tuple(fingerprint)
+
+    def load_tables(self, filename):
+        with open(filename, "rb") as tables_file:
+            data = pickle.load(tables_file)
+        self.tables_config = data["config"]
+        self.tables = data["tables"]
+        if data.get("fingerprint") != self._tables_fingerprint():
+            print(
+                f"The tables in {filename} were built from other trees or "
+                "embeddings and will be ignored, run build_tables again."
+            )
+            self.tables = None
+        elif self.tables_config != self._tables_config():
+            print(
+                f"The tables in {filename} were built with another "
+                "configuration and will be ignored."
+            )
+
+    def build_tables(self, filename, max_pairs=1000):
+        # Materializa as recomendações de cada propriedade para todas as
+        # classes cobertas pelo seu domain/range na configuração atual, de
+        # forma que possam ser servidas por consulta direta. As listas são
+        # guardadas completas, então valem para qualquer
+        # number_of_recommendations. Com filter_by=both, as propriedades com
+        # mais de max_pairs pares (domain, range) não são materializadas e
+        # continuam sendo calculadas a cada pergunta.
+        if self.order == "random" and (
+            self._must_reorder("property") or self._must_reorder("class")
+        ):
+            print("Tables cannot be built with random order.")
+            return None
+
+        covered = dict()
+        for prop_tree in ("object_properties", "data_properties"):
+            index = self._property_index(prop_tree)
+            for list_ref in ("domain", "range"):
+                for class_uri, props in index.items(list_ref):
+                    if class_uri not in self.trees["classes"]:
+                        continue
+                    for prop in props:
+                        covered.setdefault(
+                            (prop_tree, prop, list_ref), []
+                        ).append(class_uri)
+
+        self.tables = None
+        tables = dict()
+        skipped = 0
+        for prop_tree in ("object_properties", "data_properties"):
+            use_domain, use_range = self._property_filters(prop_tree)
+            for prop in self.trees[prop_tree]:
+                domains = covered.get((prop_tree, prop, "domain"), [])
+                ranges = []
+                if prop_tree == "object_properties":
+                    ranges = covered.get((prop_tree, prop, "range"), [])
+                # O lado que não é considerado no filtro é guardado como None
+                # (ver _get_related_properties)
+                pairs = (len(domains) if use_domain else 1) * (
+                    len(ranges) if use_range else 1
+                )
+                if pairs > max_pairs:
+                    skipped += 1
+                else:
+                    for domain_uri, range_uri in itertools.product(
+                        domains if use_domain else [None],
+                        ranges if use_range else [None],
+                    ):
+                        key = (
+                            "properties",
+                            prop_tree,
+                            prop,
+                            domain_uri,
+                            range_uri,
+                        )
+                        tables[key] = tuple(
+                            node.data
+                            for node in self._get_related_properties(
+                                prop,
+                                prop_tree,
+                                domain_uri,
+                                range_uri,
+                                limit=sys.maxsize,
+                            )
+                        )
+                for domain_uri in domains:
+                    tables[("classes", prop, domain_uri, None)] = tuple(
+                        node.data
+                        for node in self._get_related_classes(
+                            prop, domain_uri=domain_uri, limit=sys.maxsize
+                        )
+                    )
+                for range_uri in ranges:
+                    tables[("classes", prop, None, range_uri)] = tuple(
+                        node.data
+                        for node in self._get_related_classes(
+                            prop, range_uri=range_uri, limit=sys.maxsize
+                        )
                     )
+        if skipped:
+            print(
+                f"{skipped} properties have more than {max_pairs} "
+                "(domain, range) pairs and were not materialized."
+            )
 
-        return related
+        with open(filename, "wb") as output:
+            print(f"Saving {len(tables)} entries as {filename}")
+            pickle.dump(
+                {
+                    "config": self._tables_config(),
+                    "fingerprint": self._tables_fingerprint(),
+                    "tables": tables,
+                },
+                output,
+                pickle.HIGHEST_PROTOCOL,
+            )
+        self.tables_config = self._tables_config()
+        self.tables = tables
+        return tables
 
     # def _get_entities(self, question_triples):
     #     question_triples.sort(key=lambda x: x[1])
@@ -366,32 +991,280 @@ class Recommendation:
             
         return prop_ref, can_be_exchanged
 
+    def _cache_key(self, question_triples):
+        # Respostas embaralhadas (order=random) não são reaproveitadas
+        if self.cache.maxsize <= 0 or (
+            self.order == "random"
+            and (self._must_reorder("property") or self._must_reorder("class"))
+        ):
+            return None
+        # Os valores literais (objetos de has_value fora da ontologia) não
+        # alteram a resposta, então são trocados por marcadores. Os
+        # marcadores são tuplas, que não se confundem com nenhuma URI.
+        literals = dict()
+        for _, middle, last in question_triples:
+            if middle == "has_value" and last not in self.trees["classes"]:
+                literals.setdefault(last, ("literal", len(literals)))
+        triples = tuple(
+            (
+                literals.get(first, first),
+                middle,
+                literals.get(last, last),
+            )
+            for first, middle, last in question_triples
+        )
+        return triples, self.params
+
+    def cache_info(self):
+        return {
+            "recommendations": self.cache.stats(),
+            "search": self.search_cache.stats(),
+        }
+
+    def apply_delta(self, added=(), removed=()):
+        # Aplica triplas adicionadas e removidas à ontologia carregada,
+        # atualizando árvores, índices, embeddings e caches apenas onde os
+        # nós alterados aparecem (ver OntologyTrees.apply_delta).
+        return self._refresh(
+            self._updatable_trees().apply_delta(added, removed)
+        )
+
+    def apply_diff(self, old_source, new_source, format=None):
+        return self._refresh(
+            self._updatable_trees(schema=False).apply_diff(
+                old_source, new_source, format
+            )
+        )
+
+    def _updatable_trees(self, schema=True):
+        # As árvores em dicionários (descartadas com compact_trees) e o
+        # esquema da ontologia são carregados na primeira atualização e
+        # mantidos para as seguintes.
+        if self.onto_trees is None:
+            self.onto_trees, _ = self._open_trees()
+        if not hasattr(self.onto_trees, "apply_delta"):
+            raise ValueError(
+                "Trees opened from the binary format cannot be updated."
+            )
+        if (
+            schema
+            and not self.onto_trees.updatable
+            and os.path.isfile(self._ontology_path)
+        ):
+            self.onto_trees.load_schema(
+                self._ontology_path, self._ontology_format
+            )
+        return self.onto_trees
+
+    def _refresh(self, changed):
+        # As instâncias com outros parâmetros são recriadas quando pedidas
+        self._variants.clear()
+        if self.trees is not self.onto_trees.trees:
+            # As árvores compactas são refeitas, então os nós guardados em
+            # cache deixam de valer.
+            self.trees = self.onto_trees.compact()
+            self._level_indexes.clear()
+            self.cache.clear()
+            self.search_cache.clear()
+
+        # Nós alterados e nós cujos ancestrais mudaram
+        for key_tree, keys in changed.items():
+            if keys:
+                self._level_indexes.pop(key_tree, None)
+        affected = dict()
+        for key_tree, keys in changed.items():
+            index = self.indexes.get(key_tree)
+            if index is not None:
+                affected[key_tree] = set(keys) | index.update(
+                    self.trees[key_tree], keys
+                )
+            else:
+                # Sem o índice, os ancestrais anteriores não são conhecidos,
+                # então todos os descendentes são considerados afetados
+                affected[key_tree] = self._with_descendants(key_tree, keys)
+        for prop_tree in ("object_properties", "data_properties"):
+            if affected["classes"] or affected[prop_tree]:
+                # Reconstruído na próxima consulta
+                self.property_indexes.pop(prop_tree, None)
+        if self._node_embeddings[0] is not None:
+            self._node_embeddings[0].update(
+                self.trees, set().union(*changed.values())
+            )
+        self._neighbor_indexes.clear()
+        if self.tables is not None and any(affected.values()):
+            print(
+                "The recommendation tables are out of date and will be "
+                "ignored, run build_tables again."
+            )
+            self.tables = None
+        self._invalidate(affected)
+        return changed
+
+    def _with_descendants(self, key_tree, keys):
+        tree = self.trees[key_tree]
+        found = set(keys)
+        pending = [key for key in found if key in tree]
+        while pending:
+            for child in tree[pending.pop()].children:
+                if child not in found and child in tree:
+                    found.add(child)
+                    pending.append(child)
+        return found
+
+    def _touches(
+        self, changed, node_key, key_tree, root, depth, family_position
+    ):
+        # Verifica se a busca a partir de node_key (o caminho até o nó de
+        # referência e os níveis abaixo dele) passa por algum nó alterado
+        keys = changed.get(key_tree)
+        if not keys:
+            return False
+        if node_key in keys:
+            return True
+        tree = self.trees[key_tree]
+        if node_key not in tree:
+            return False
+        node = tree[node_key]
+        for _ in range(-family_position):
+            if node.data == root or node.parent not in tree:
+                break
+            node = tree[node.parent]
+            if node.data in keys:
+                return True
+        return any(
+            item.data in keys
+            for item in self._iter_level_order(None, node, depth, key_tree)
+        )
+
+    def _invalidate(self, changed):
+        # Remove dos caches apenas as buscas e respostas afetadas
+        touched = dict()
+
+        def touches(node_key, key_tree, root, depth, family_position):
+            key = (node_key, key_tree, root, depth, family_position)
+            if key not in touched:
+                touched[key] = self._touches(changed, *key)
+            return touched[key]
+
+        def question_touched(key, _):
+            triples, config = key
+            # Os vizinhos semânticos podem vir de qualquer ponto da árvore
+            if config[-1] > 0:
+                return True
+            return any(
+                touches(
+                    uri, key_tree, self.roots[key_tree], config[0], config[1]
+                )
+                for uri in {
+                    uri
+                    for triple in triples
+                    for uri in triple
+                    if isinstance(uri, str)
+                }
+                for key_tree in changed
+            )
+
+        self.search_cache.invalidate(lambda key, _: touches(*key))
+        self.cache.invalidate(question_touched)
+
+    def close(self):
+        # Libera as árvores abertas com mmap (as demais não mantêm arquivos
+        # abertos). Com perguntas em andamento, inclusive nas variantes, a
+        # liberação acontece quando a última terminar.
+        if self._usage is None:
+            return
+        with self._usage_lock:
+            self._usage[1] = True
+            if self._usage[0] == 0:
+                self.onto_trees.close()
+
+    @property
+    def closed(self):
+        return self._usage is not None and self.onto_trees.closed
+
+    def _call_open(self, method, *args):
+        # Executa method impedindo que as árvores mapeadas sejam liberadas
+        # durante a chamada (ver close)
+        usage = self._usage
+        if usage is None:
+            return method(*args)
+        with self._usage_lock:
+            if self.onto_trees.closed:
+                raise ValueError("The recommendation was closed.")
+            usage[0] += 1
+        try:
+            return method(*args)
+        finally:
+            with self._usage_lock:
+                usage[0] -= 1
+                if usage[1] and usage[0] == 0:
+                    self.onto_trees.close()
+
+    def get_recommendations(self, question_triples, nlg=None, params=None):
+        return self._call_open(
+            self._get_cached_recommendations, question_triples, nlg, params
+        )
+
+    def _get_cached_recommendations(self, question_triples, nlg, params):
+        if params is not None:
+            variant = self.with_params(params)
+            if variant is not self:
+                return variant.get_recommendations(question_triples, nlg)
+        key = self._cache_key(question_triples)
+        if key is None:
+            return self._get_recommendations(question_triples)
+        cached = self.cache.get(key)
+        if cached is None:
+            suggestion_text, recommendations = self._get_recommendations(
+                question_triples
+            )
+            cached = (suggestion_text, tuple(recommendations))
+            self.cache.put(key, cached)
+        return cached[0], list(cached[1])
 
-    def get_recommendations(self, question_triples, nlg=None):
+    def _get_recommendations(self, question_triples):
         # nlg = nlg[0]
-        recommendations = []
+        # Apenas as recomendações utilizadas são formatadas
+        nodes = list(
+            itertools.islice(
+                self._iter_recommendations(question_triples), self.size
+            )
+        )
+        return self.suggestion_text, self._format_recommendations(nodes)
+
+    def _format_recommendations(self, nodes):
+        return [self.text.format(rec.name) for rec in nodes]
+
+    def _iter_recommendations(self, question_triples):
+        # Gera os nós recomendados em ordem. Cada busca recebe quantas
+        # recomendações ainda faltam, e a geração para ao atingir
+        # number_of_recommendations.
         prop_ref, entities = self.entities_that_can_be_exchanged(question_triples)
-        verified_entities = []
+        verified_entities = set()
+        remaining = self.size
 
         for subj, pred, obj in question_triples:
+            if remaining <= 0:
+                return
             if pred == "has_value":
                 if entities[obj] and obj not in verified_entities:
-                    verified_entities.append(obj)
+                    verified_entities.add(obj)
                     prop = prop_ref[obj]
                     # uri = self.trees["classes"][obj].data
                     if subj in self.trees["classes"]:
                         # name = self.trees["classes"][subj].name
                         for rec in self._get_related_classes(
-                            prop, range_uri=obj
+                            prop, range_uri=obj, limit=remaining
                         ):
-                            recommendations.append(self.text.format(rec.name))
+                            remaining -= 1
+                            yield rec
             else:
                 if (
                     entities[obj]
                     and entities[pred]
                     and obj not in verified_entities
                 ):
-                    verified_entities.append(obj)
+                    verified_entities.add(obj)
                     if pred in self.trees["object_properties"]:
                         # name = self.trees["object_properties"][pred].name
                         for rec in self._get_related_properties(
@@ -399,26 +1272,445 @@ class Recommendation:
                             "object_properties",
                             domain_uri=subj,
                             range_uri=obj,
+                            limit=remaining,
                         ):
-                            recommendations.append(
-                                self.text.format(rec.name)
-                            )
+                            remaining -= 1
+                            yield rec
                     else:
                         if pred in self.trees["data_properties"]:
                             # name = self.trees["data_properties"][pred].name
                             for rec in self._get_related_properties(
-                                pred, "data_properties", domain_uri=subj
+                                pred,
+                                "data_properties",
+                                domain_uri=subj,
+                                limit=remaining,
                             ):
-                                recommendations.append(
-                                    self.text.format(rec.name)
-                                )
-                if entities[subj] and subj not in verified_entities:
-                    verified_entities.append(subj)
+                                remaining -= 1
+                                yield rec
+                if (
+                    remaining > 0
+                    and entities[subj]
+                    and subj not in verified_entities
+                ):
+                    verified_entities.add(subj)
                     if subj in self.trees["classes"]:
                         # name = self.trees["classes"][subj].name
-                        for rec in self._get_related_classes(pred, subj):
-                            recommendations.append(
-                                self.text.format(rec.name)
-                            )
+                        for rec in self._get_related_classes(
+                            pred, subj, limit=remaining
+                        ):
+                            remaining -= 1
+                            yield rec
+
+    def enable_tracing(self, callback=None):
+        # Mede, a cada chamada de get_recommendations, o tempo de cada etapa
+        # e conta os nós visitados nas buscas, as verificações de
+        # ancestrais, as consultas aos embeddings (e as palavras trocadas
+        # por "unk") e os acertos dos caches. O Trace de cada chamada é
+        # entregue ao Tracer retornado, que repassa um dicionário ao
+        # callback e acumula os totais (ver Tracer.prometheus). callback
+        # também pode ser um Tracer já existente.
+        #
+        # Os métodos medidos são substituídos apenas nesta instância (e nas
+        # suas variantes), então sem tracing o custo é nenhum.
+        tracer = callback if isinstance(callback, Tracer) else Tracer(callback)
+        self._variants.clear()
+        self._install_tracing(tracer)
+        return tracer
+
+    def disable_tracing(self):
+        self._variants.clear()
+        for name in _TRACED_METHODS:
+            self.__dict__.pop(name, None)
+        self.tracer = None
+
+    @contextlib.contextmanager
+    def tracing(self, callback=None):
+        tracer = self.enable_tracing(callback)
+        try:
+            yield tracer
+        finally:
+            self.disable_tracing()
+
+    def _install_tracing(self, tracer):
+        # Os métodos originais são ligados a esta instância, e não aos da
+        # instância copiada em with_params.
+        methods = {
+            name: getattr(type(self), name).__get__(self)
+            for name in _TRACED_METHODS
+        }
 
-        return self.suggestion_text, recommendations[: self.size]
+        def timed(name, stage):
+            method = methods[name]
+
+            def wrapper(*args, **kwargs):
+                trace = current_trace()
+                if trace is None:
+                    return method(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    trace.add_time(stage, time.perf_counter() - start)
+
+            return wrapper
+
+        def get_recommendations(question_triples, nlg=None, params=None):
+            method = methods["get_recommendations"]
+            # Chamadas internas (variantes) entram no Trace já iniciado
+            if current_trace() is not None:
+                return method(question_triples, nlg, params)
+            # Os contadores dos caches são compartilhados, então os acertos
+            # de chamadas simultâneas podem se misturar.
+            caches = {"cache": self.cache, "search_cache": self.search_cache}
+            before = {
+                name: (cache.hits, cache.misses)
+                for name, cache in caches.items()
+            }
+            with Trace() as trace:
+                result = method(question_triples, nlg, params)
+            for name, cache in caches.items():
+                hits, misses = before[name]
+                trace.count(f"{name}_hits", cache.hits - hits)
+                trace.count(f"{name}_misses", cache.misses - misses)
+            tracer.record(trace)
+            return result
+
+        def search_nodes(node_key, key_tree, root):
+            trace = current_trace()
+            nodes = search(node_key, key_tree, root)
+            if trace is None:
+                return nodes
+            return _traced_nodes(trace, nodes)
+
+        def is_descendent_of(classe, super_classe):
+            trace = current_trace()
+            if trace is not None:
+                trace.count("ancestor_checks")
+            return methods["_is_descendent_of"](classe, super_classe)
+
+        def order_and_filter_by_similarity(source, targets, limit=None):
+            trace = current_trace()
+            if trace is not None and targets:
+                trace.count("embedding_lookups", len(targets) + 1)
+                trace.count(
+                    "unknown_words",
+                    self.node_embeddings.unknown_words([source, *targets]),
+                )
+            return similarity(source, targets, limit)
+
+        search = timed("_search_nodes", "search")
+        similarity = timed("_order_and_filter_by_similarity", "similarity")
+        self.get_recommendations = get_recommendations
+        self.entities_that_can_be_exchanged = timed(
+            "entities_that_can_be_exchanged", "entities"
+        )
+        self._search_nodes = search_nodes
+        self._has_ancestor_in = timed("_has_ancestor_in", "ancestors")
+        self._is_descendent_of = is_descendent_of
+        self._order_and_filter_by_similarity = order_and_filter_by_similarity
+        self._format_recommendations = timed(
+            "_format_recommendations", "format"
+        )
+        self.tracer = tracer
+
+    def get_recommendations_batch(self, questions, workers=None, params=None):
+        # Processa várias perguntas, retornando os resultados na mesma ordem.
+        # Os processos são criados via fork e reaproveitam a ontologia, as
+        # árvores e os embeddings já carregados nesta instância.
+        return self._call_open(
+            self._get_recommendations_batch, questions, workers, params
+        )
+
+    def _get_recommendations_batch(self, questions, workers, params):
+        global _batch_recommendation
+        if params is not None and self.with_params(params) is not self:
+            return self.with_params(params).get_recommendations_batch(
+                questions, workers
+            )
+        questions = list(questions)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(questions))
+        if (
+            workers <= 1
+            or "fork" not in multiprocessing.get_all_start_methods()
+        ):
+            return [self.get_recommendations(q) for q in questions]
+
+        _batch_recommendation = self
+        try:
+            context = multiprocessing.get_context("fork")
+            # Cada processo recebe uma nova semente para o random.shuffle
+            with context.Pool(workers, initializer=random.seed) as pool:
+                return pool.map(
+                    _batch_worker,
+                    questions,
+                    chunksize=max(1, len(questions) // (workers * 4)),
+                )
+        finally:
+            _batch_recommendation = None
+
+
+class ReloadableRecommendation:
+    # Mantém uma Recommendation (snapshot) que pode ser trocada por outra,
+    # construída a partir da ontologia e do recommendation.ini atuais, sem
+    # interromper as perguntas em andamento: cada chamada usa o snapshot
+    # vigente no seu início, e a troca é a atribuição de uma referência.
+    def __init__(self, config_path=None, embedding_store=None):
+        self._current = Recommendation(
+            config_path=config_path, embedding_store=embedding_store
+        )
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._stop_watching = threading.Event()
+        # Funções chamadas com cada novo snapshot antes que ele substitua o
+        # atual
+        self.on_reload = []
+
+    @property
+    def current(self):
+        return self._current
+
+    def reload(self, background=False):
+        # Constrói o novo snapshot (árvores, índices e configuração),
+        # reaproveitando os embeddings se o model_path não mudou. Os índices
+        # e os embeddings dos nós são construídos antes da troca, para que
+        # as primeiras perguntas no novo snapshot não paguem por eles.
+        if background:
+            thread = threading.Thread(target=self.reload, daemon=True)
+            thread.start()
+            return thread
+        with self._reload_lock:
+            snapshot = Recommendation(
+                previous=self._current,
+                config_path=self._current.config_path,
+                embedding_store=self._current.embedding_store,
+            )
+            # O tracing continua no novo snapshot, com o mesmo Tracer
+            if self._current.tracer is not None:
+                snapshot.enable_tracing(self._current.tracer)
+            for callback in self.on_reload:
+                callback(snapshot)
+            snapshot.warm()
+            previous, self._current = self._current, snapshot
+        previous.close()
+        return snapshot
+
+    def _files_state(self):
+        state = []
+        for path in (self._current.config_path, self._current.trees_path):
+            try:
+                stat = os.stat(path)
+                state.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                state.append((path, None, None))
+        return state
+
+    def watch(self, interval=5.0):
+        # Recarrega sempre que o recommendation.ini ou o arquivo das árvores
+        # for alterado. Se o reload falhar, o snapshot atual é mantido.
+        if self._watcher is not None:
+            return self._watcher
+
+        def run():
+            state = self._files_state()
+            pending = None
+            while not self._stop_watching.wait(interval):
+                current_state = self._files_state()
+                if current_state == state:
+                    pending = None
+                    continue
+                # Espera os arquivos pararem de mudar (escrita em andamento)
+                if current_state != pending:
+                    pending = current_state
+                    continue
+                try:
+                    self.reload()
+                except Exception as error:
+                    print(
+                        f"Reload failed, keeping the current snapshot: {error}"
+                    )
+                state, pending = current_state, None
+
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=run, daemon=True)
+        self._watcher.start()
+        return self._watcher
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._stop_watching.set()
+            self._watcher.join()
+            self._watcher = None
+
+    def _call(self, name, *args):
+        # Se o snapshot for substituído (e liberado, ver Recommendation.close)
+        # entre a leitura e a chamada, ela é repetida no novo
+        while True:
+            snapshot = self._current
+            try:
+                return getattr(snapshot, name)(*args)
+            except ValueError:
+                if not snapshot.closed or snapshot is self._current:
+                    raise
+
+    def get_recommendations(self, question_triples, nlg=None, params=None):
+        return self._call("get_recommendations", question_triples, nlg, params)
+
+    def get_recommendations_batch(self, questions, workers=None, params=None):
+        return self._call(
+            "get_recommendations_batch", questions, workers, params
+        )
+
+    def __getattr__(self, name):
+        # Demais atributos (trees, cache_info, ...) vêm do snapshot atual
+        if name == "_current":
+            raise AttributeError(name)
+        return getattr(self._current, name)
+
+
+class EmbeddingStore:
+    # Modelos de embeddings (um por model_path) compartilhados pelas
+    # Recommendation de um mesmo processo, de forma que cada modelo seja
+    # carregado uma única vez. O store guarda apenas referências fracas:
+    # um modelo é liberado quando nenhuma Recommendation o utiliza (por
+    # exemplo, quando o OntologyRegistry descarrega a última ontologia que
+    # o usava).
+    def __init__(self):
+        self._models = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, model_path):
+        with self._lock:
+            model = self._models.get(model_path)
+            if model is None:
+                from ontotrees import load_word_vectors
+
+                model = load_word_vectors(model_path)
+                self._models[model_path] = model
+        return model
+
+    def __contains__(self, model_path):
+        return model_path in self._models
+
+    def __len__(self):
+        return len(self._models)
+
+
+class OntologyRegistry:
+    # Várias ontologias em um único processo, cada uma identificada por um
+    # nome e descrita pelo seu recommendation.ini (árvores, labels,
+    # embeddings e parâmetros). Cada ontologia é carregada na primeira
+    # pergunta, e as menos usadas são descarregadas quando houver mais de
+    # max_loaded carregadas. Os modelos de embeddings são compartilhados por
+    # todas (ver EmbeddingStore).
+    def __init__(self, ontologies=None, max_loaded=4, embedding_store=None):
+        self._configs = dict()
+        # As ontologias descarregadas são liberadas (ver Recommendation.close)
+        self._loaded = LRUCache(
+            max_loaded,
+            on_remove=lambda _, recommendation: recommendation.close(),
+        )
+        self._load_locks = dict()
+        self._lock = threading.Lock()
+        # Um store vazio é falso (ver EmbeddingStore.__len__)
+        if embedding_store is None:
+            embedding_store = EmbeddingStore()
+        self.embedding_store = embedding_store
+        self.tracer = None
+        # Funções chamadas com cada ontologia carregada, antes que ela
+        # responda perguntas
+        self.on_load = []
+        for name, config_path in (ontologies or {}).items():
+            self.register(name, config_path)
+
+    @classmethod
+    def from_config(cls, filename, max_loaded=None):
+        # Arquivo com uma seção por ontologia, cada uma com o config_path
+        # do seu recommendation.ini (relativo ao arquivo). Na seção DEFAULT,
+        # max_loaded define quantas ficam carregadas ao mesmo tempo.
+        config = configparser.ConfigParser(delimiters="=")
+        config.read(filename)
+        base = os.path.dirname(os.path.abspath(filename))
+        if max_loaded is None:
+            max_loaded = config["DEFAULT"].getint("max_loaded", fallback=4)
+        return cls(
+            {
+                name: os.path.join(base, config[name]["config_path"])
+                for name in config.sections()
+            },
+            max_loaded,
+        )
+
+    def register(self, name, config_path):
+        with self._lock:
+            self._configs[name] = config_path
+        self.unload(name)
+
+    def unload(self, name):
+        self._loaded.invalidate(lambda key, _: key == name)
+
+    @property
+    def names(self):
+        return list(self._configs)
+
+    def loaded(self):
+        return [name for name in self._configs if name in self._loaded]
+
+    def get(self, name):
+        recommendation = self._loaded.get(name)
+        if recommendation is not None:
+            return recommendation
+        if name not in self._configs:
+            raise ValueError(f"Unknown ontology: {name}")
+        # Perguntas simultâneas para a mesma ontologia esperam uma única
+        # carga
+        with self._lock:
+            lock = self._load_locks.setdefault(name, threading.Lock())
+        with lock:
+            recommendation = self._loaded.get(name)
+            if recommendation is None:
+                recommendation = Recommendation(
+                    config_path=self._configs[name],
+                    embedding_store=self.embedding_store,
+                )
+                if self.tracer is not None:
+                    recommendation.enable_tracing(self.tracer)
+                for callback in self.on_load:
+                    callback(recommendation)
+                self._loaded.put(name, recommendation)
+        return recommendation
+
+    def enable_tracing(self, callback=None):
+        # Um único Tracer para todas as ontologias, inclusive as que forem
+        # carregadas depois (ver Recommendation.enable_tracing)
+        tracer = callback if isinstance(callback, Tracer) else Tracer(callback)
+        self.tracer = tracer
+        for name in self.loaded():
+            self.get(name).enable_tracing(tracer)
+        return tracer
+
+    def _call(self, ontology, name, *args):
+        # Se a ontologia for descarregada (e liberada) entre o get e a
+        # chamada, ela é carregada novamente
+        while True:
+            recommendation = self.get(ontology)
+            try:
+                return getattr(recommendation, name)(*args)
+            except ValueError:
+                if not recommendation.closed:
+                    raise
+
+    def get_recommendations(
+        self, ontology, question_triples, nlg=None, params=None
+    ):
+        return self._call(
+            ontology, "get_recommendations", question_triples, nlg, params
+        )
+
+    def get_recommendations_batch(
+        self, ontology, questions, workers=None, params=None
+    ):
+        return self._call(
+            ontology, "get_recommendations_batch", questions, workers, params
+        )
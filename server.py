@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from recommendations import (
+    OntologyRegistry,
+    Recommendation,
+    ReloadableRecommendation,
+)
+
+
+class RecommendationServer:
+    # Serve uma única Recommendation (já carregada) para vários clientes
+    # por um socket TCP, com uma requisição JSON por linha:
+    #
+    #   {"id": 1, "question": [[sujeito, predicado, objeto], ...],
+    #    "params": {"depth": 2}}
+    #
+    # e uma resposta por linha, com o mesmo "id" e os campos
+    # "suggestion_text" e "recommendations" (ou "error"). {"stats": true}
+    # retorna os contadores do servidor e dos caches e, com o tracing
+    # ativo, {"metrics": true} retorna as métricas no formato texto do
+    # Prometheus.
+    #
+    # Com um OntologyRegistry, cada requisição indica também a ontologia
+    # ("ontology": nome).
+    #
+    # As recomendações são calculadas em um pool de threads. Requisições
+    # idênticas em andamento são respondidas por um único cálculo, e as
+    # similaridades semânticas de requisições simultâneas são calculadas
+    # em lote (ver SimilarityBatcher).
+    def __init__(self, recommendation, workers=None, batch_window=0.002):
+        self.recommendation = recommendation
+        self.executor = ThreadPoolExecutor(workers)
+        self.batch_window = batch_window
+        self.requests = 0
+        self.coalesced = 0
+        self._in_flight = dict()
+        # Os snapshots são preparados uma única vez, antes de responderem
+        # perguntas: os atuais aqui, e os novos quando forem carregados
+        if isinstance(recommendation, OntologyRegistry):
+            recommendation.on_load.append(self._prepare)
+            for name in recommendation.loaded():
+                self._prepare(recommendation.get(name))
+        elif isinstance(recommendation, ReloadableRecommendation):
+            recommendation.on_reload.append(self._prepare)
+            self._prepare(recommendation.current)
+        else:
+            self._prepare(recommendation)
+
+    def _prepare(self, snapshot):
+        # Similaridades de perguntas simultâneas calculadas em lote
+        if self.batch_window:
+            from ontotrees import SimilarityBatcher
+
+            snapshot.wrap_embeddings(
+                lambda node_embeddings: SimilarityBatcher(
+                    node_embeddings, self.batch_window
+                )
+            )
+
+    def _run(self, ontology, question, params):
+        # Executado no pool, pois carregar uma ontologia do registro pode
+        # demorar. As chamadas passam pelo registro (ou pelo
+        # ReloadableRecommendation), que as repete no snapshot atual se o
+        # obtido tiver sido liberado.
+        recommendation = self.recommendation
+        if isinstance(recommendation, OntologyRegistry):
+            return recommendation.get_recommendations(
+                ontology, question, params=params
+            )
+        return recommendation.get_recommendations(question, params=params)
+
+    async def recommend(self, question, params=None, ontology=None):
+        question = [tuple(triple) for triple in question]
+        # Os parâmetros vêm do JSON e podem conter listas ou objetos
+        key = (
+            ontology,
+            tuple(question),
+            json.dumps(params or {}, sort_keys=True),
+        )
+        self.requests += 1
+        future = self._in_flight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self.executor, self._run, ontology, question, params
+            )
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # O cancelamento de um cliente não cancela o cálculo compartilhado
+        suggestion_text, recommendations = await asyncio.shield(future)
+        return {
+            "suggestion_text": suggestion_text,
+            "recommendations": recommendations,
+        }
+
+    def stats(self):
+        stats = {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
+        if isinstance(self.recommendation, OntologyRegistry):
+            stats["ontologies"] = {
+                name: self.recommendation.get(name).cache_info()
+                for name in self.recommendation.loaded()
+            }
+            return stats
+        snapshot = getattr(self.recommendation, "current", self.recommendation)
+        stats["cache"] = snapshot.cache_info()
+        node_embeddings = getattr(snapshot, "node_embeddings", None)
+        if hasattr(node_embeddings, "batches"):
+            stats["similarity_batches"] = node_embeddings.batches
+            stats["similarity_requests"] = node_embeddings.requests
+        return stats
+
+    def metrics(self):
+        tracer = self.recommendation.tracer
+        if tracer is None:
+            raise ValueError("Tracing is not enabled (use --trace).")
+        return {"metrics": tracer.prometheus()}
+
+    async def _respond(self, line, writer):
+        request = None
+        try:
+            request = json.loads(line)
+            if request.get("stats"):
+                response = self.stats()
+            elif request.get("metrics"):
+                response = self.metrics()
+            else:
+                response = await self.recommend(
+                    request["question"],
+                    request.get("params"),
+                    request.get("ontology"),
+                )
+        except Exception as error:
+            response = {"error": f"{type(error).__name__}: {error}"}
+        if isinstance(request, dict) and "id" in request:
+            response["id"] = request["id"]
+        writer.write(
+            (json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8")
+        )
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        # As linhas de uma mesma conexão são processadas em paralelo, e as
+        # respostas são enviadas à medida que ficam prontas.
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(self._respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self._handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve as recomendações por TCP, com uma requisição JSON "
+        "por linha."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="threads de cálculo"
+    )
+    parser.add_argument(
+        "--batch-window",
+        type=float,
+        default=0.002,
+        help="janela (em segundos) para agrupar as similaridades, 0 desativa",
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        default=None,
+        help="recarrega a configuração e as árvores quando forem alteradas, "
+        "verificando a cada WATCH segundos",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help='mede as etapas de cada recomendação (ver {"metrics": true})',
+    )
+    parser.add_argument(
+        "--ontologies",
+        help="arquivo com uma seção (nome e config_path) por ontologia, "
+        'escolhida pelo campo "ontology" das requisições',
+    )
+    args = parser.parse_args()
+
+    if args.ontologies:
+        recommendation = OntologyRegistry.from_config(args.ontologies)
+    elif args.watch:
+        recommendation = ReloadableRecommendation()
+        recommendation.watch(args.watch)
+    else:
+        recommendation = Recommendation()
+    if args.trace:
+        recommendation.enable_tracing()
+    server = RecommendationServer(
+        recommendation, args.workers, args.batch_window
+    )
+    print(f"Serving recommendations on {args.host}:{args.port}")
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
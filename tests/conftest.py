@@ -0,0 +1,107 @@
+import configparser
+import pathlib
+import random
+import sys
+
+import pytest
+
+ROOT = pathlib.Path(__file__).parent.parent.absolute()
+# Os scripts do repositório importam recommendations e ontotrees a partir
+# da raiz
+sys.path.insert(0, str(ROOT))
+
+from ontotrees import OntologyTrees  # noqa: E402
+
+M = "http://www.movieontology.org/2009/10/01/movieontology.owl#"
+ONTOLOGY = ROOT / "movieontology.ttl"
+LABELS = ROOT / "properties_labels.ini"
+
+
+def same_trees(first, second, ordered=True):
+    # Compara as árvores nó a nó (as árvores compactas e mapeadas também
+    # têm data, name, parent, children, domains e ranges). Sem ordered, a
+    # ordem dos filhos, domains e ranges não é considerada (a das consultas
+    # SPARQL do rdflib não é determinística).
+    arrange = list if ordered else sorted
+    assert list(first) == list(second)
+    for name in first:
+        assert sorted(first[name]) == sorted(second[name]), name
+        for key in first[name]:
+            a, b = first[name][key], second[name][key]
+            assert (a.data, a.name, a.parent) == (b.data, b.name, b.parent)
+            assert arrange(a.children) == arrange(b.children), key
+            assert arrange(a.domains) == arrange(b.domains), key
+            assert arrange(a.ranges) == arrange(b.ranges), key
+
+
+@pytest.fixture(scope="session")
+def ontology_nt(tmp_path_factory):
+    # A ontologia em N-Triples, lida linha a linha pelo carregador em fluxo
+    import rdflib
+
+    path = tmp_path_factory.mktemp("ontology") / "movieontology.nt"
+    graph = rdflib.Graph()
+    graph.parse(str(ONTOLOGY), format="ttl")
+    graph.serialize(destination=str(path), format="nt", encoding="utf-8")
+    return path
+
+
+@pytest.fixture(scope="session")
+def onto_trees():
+    trees = OntologyTrees(labels_filename=str(LABELS))
+    trees.load_ontology_stream(str(ONTOLOGY), format="ttl")
+    return trees
+
+
+@pytest.fixture(scope="session")
+def model_path(tmp_path_factory, onto_trees):
+    # Modelo word2vec (texto) pequeno com as palavras dos nomes dos nós
+    rng = random.Random(0)
+    path = tmp_path_factory.mktemp("model") / "model.txt"
+    words = sorted(onto_trees.vocabulary())
+    lines = [f"{len(words)} 8"]
+    for word in words:
+        vector = " ".join(f"{rng.uniform(-1, 1):.4f}" for _ in range(8))
+        lines.append(f"{word} {vector}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def write_config(tmp_path, model_path):
+    # Cria um recommendation.ini (com caminhos absolutos) a partir do
+    # recommendation.ini do repositório, alterando os valores informados
+    def write(name="recommendation.ini", **values):
+        config = configparser.ConfigParser(delimiters="=")
+        config.read(ROOT / "recommendation.ini")
+        settings = config["DEFAULT"]
+        settings["ontology_filename"] = str(ONTOLOGY)
+        settings["labels_filename"] = str(LABELS)
+        settings["trees_filename"] = str(ROOT / "ontology_trees.pkl")
+        settings["model_path"] = str(model_path)
+        for key, value in values.items():
+            settings[key] = str(value)
+        path = tmp_path / name
+        with open(path, "w") as config_file:
+            config.write(config_file)
+        return str(path)
+
+    return write
+
+
+def questions(recommendation):
+    # Perguntas de uma tripla para cada propriedade (com seus domains e
+    # ranges) e algumas com has_value
+    result = [
+        [(M + "Movie", "has_value", "Avatar")],
+        [
+            (M + "Movie", "has_value", "Avatar"),
+            (M + "Movie", M + "belongsToGenre", M + "Genre"),
+        ],
+        [(M + "Movie", M + "hasDirector", M + "Director")],
+    ]
+    for key, node in recommendation.trees["object_properties"].items():
+        for domain in node.domains:
+            for range_uri in node.ranges:
+                result.append([(domain, key, range_uri)])
+    return result
@@ -0,0 +1,55 @@
+import pytest
+
+from conftest import M
+from recommendations import Recommendation
+
+
+def question(value):
+    return [
+        (M + "Movie", "has_value", value),
+        (M + "Movie", M + "belongsToGenre", M + "Genre"),
+    ]
+
+
+@pytest.fixture
+def recommendation(write_config):
+    return Recommendation(config_path=write_config(cache_size=10))
+
+
+def test_literals_share_one_entry(recommendation, write_config):
+    uncached = Recommendation(config_path=write_config())
+    first = recommendation.get_recommendations(question("Avatar"))
+    second = recommendation.get_recommendations(question("Titanic"))
+    assert first == second == uncached.get_recommendations(question("Avatar"))
+    stats = recommendation.cache_info()["recommendations"]
+    assert (stats["size"], stats["hits"], stats["misses"]) == (1, 1, 1)
+    assert recommendation._cache_key(question("Avatar")) == (
+        recommendation._cache_key(question("Titanic"))
+    )
+
+
+def test_classes_are_not_literals(recommendation):
+    # Objetos de has_value que são classes da ontologia fazem parte da chave
+    genre, director = (
+        recommendation._cache_key(question(M + "Genre")),
+        recommendation._cache_key(question(M + "Director")),
+    )
+    assert genre != director
+
+
+def test_key_includes_params(recommendation):
+    key = recommendation._cache_key(question("Avatar"))
+    assert key[1] == recommendation.params
+    recommendation.get_recommendations(question("Avatar"))
+    # As variantes compartilham o cache, com outra chave
+    recommendation.get_recommendations(question("Avatar"), params={"depth": 1})
+    assert recommendation.cache_info()["recommendations"]["size"] == 2
+    variant = recommendation.with_params({"depth": 1})
+    assert variant._cache_key(question("Avatar"))[1] == variant.params
+
+
+def test_random_order_is_not_cached(recommendation):
+    variant = recommendation.with_params({"order": "random"})
+    assert variant._cache_key(question("Avatar")) is None
+    variant.get_recommendations(question("Avatar"))
+    assert recommendation.cache_info()["recommendations"]["size"] == 0
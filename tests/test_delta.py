@@ -0,0 +1,170 @@
+import pickle
+import random
+
+import pytest
+
+from conftest import LABELS, questions, same_trees
+from ontotrees import OntologyTrees
+from ontotrees.stream import read_schema_triples
+from recommendations import Recommendation
+
+RDFS = "http://www.w3.org/2000/01/rdf-schema#"
+
+
+def build(path, keep_schema=True):
+    # Com lang="en", cada nó tem no máximo um label, então o nome não
+    # depende da ordem em que os labels foram adicionados
+    onto_trees = OntologyTrees("en", labels_filename=str(LABELS))
+    onto_trees.load_ontology_stream(str(path), "nt", keep_schema=keep_schema)
+    return onto_trees
+
+
+def schema_lines(lines):
+    predicates = ("subClassOf", "subPropertyOf", "domain", "range", "label")
+    return [
+        number
+        for number, line in enumerate(lines)
+        if any(f"<{RDFS}{predicate}>" in line for predicate in predicates)
+    ]
+
+
+def unordered(answer):
+    text, suggestions = answer
+    return text, sorted(suggestions)
+
+
+def write_lines(path, lines):
+    path.write_text("".join(lines), encoding="utf-8")
+    return path
+
+
+@pytest.fixture(scope="module")
+def lines(ontology_nt):
+    return ontology_nt.read_text(encoding="utf-8").splitlines(True)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_apply_delta_matches_rebuild(tmp_path, ontology_nt, lines, seed):
+    rng = random.Random(seed)
+    removed_lines = set(rng.sample(schema_lines(lines), 30))
+    new_path = write_lines(
+        tmp_path / "new.nt",
+        [line for n, line in enumerate(lines) if n not in removed_lines],
+    )
+    old_triples = read_schema_triples(str(ontology_nt), "nt")
+    new_triples = set(read_schema_triples(str(new_path), "nt"))
+    removed = [triple for triple in old_triples if triple not in new_triples]
+
+    onto_trees = build(ontology_nt)
+    changed = onto_trees.apply_delta(removed=removed)
+    assert any(changed.values())
+    same_trees(build(new_path).trees, onto_trees.trees, ordered=False)
+
+    # Readicionar as triplas volta às árvores originais
+    onto_trees.apply_delta(added=removed)
+    same_trees(build(ontology_nt).trees, onto_trees.trees, ordered=False)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_apply_diff_matches_rebuild(tmp_path, ontology_nt, lines, seed):
+    rng = random.Random(seed)
+    numbers = schema_lines(lines)
+    removed_lines = set(rng.sample(numbers, 30))
+    # Algumas triplas removidas voltam com outro sujeito, além de uma
+    # classe nova com um pai novo
+    extra = []
+    for number in rng.sample(sorted(removed_lines), 10):
+        _, predicate, rest = lines[number].split(" ", 2)
+        subject = lines[rng.choice(numbers)].split(" ", 1)[0]
+        extra.append(" ".join([subject, predicate, rest]))
+    extra += [
+        "<http://example.org/New> "
+        "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type> "
+        "<http://www.w3.org/2002/07/owl#Class> .\n",
+        f"<http://example.org/New> <{RDFS}subClassOf> "
+        "<http://example.org/NewParent> .\n",
+        f'<http://example.org/NewParent> <{RDFS}label> "new parent"@en .\n',
+    ]
+    new_path = write_lines(
+        tmp_path / "new.nt",
+        [line for n, line in enumerate(lines) if n not in removed_lines]
+        + extra,
+    )
+
+    onto_trees = build(ontology_nt, keep_schema=False)
+    changed = onto_trees.apply_diff(str(ontology_nt), str(new_path), "nt")
+    assert "http://example.org/New" in changed["classes"]
+    same_trees(build(new_path).trees, onto_trees.trees, ordered=False)
+
+    onto_trees.apply_diff(str(new_path), str(ontology_nt), "nt")
+    same_trees(build(ontology_nt).trees, onto_trees.trees, ordered=False)
+
+
+def test_schema_is_not_pickled(ontology_nt):
+    assert not build(ontology_nt, keep_schema=False).updatable
+    onto_trees = build(ontology_nt)
+    assert onto_trees.updatable
+
+    loaded = pickle.loads(pickle.dumps(onto_trees))
+    assert not loaded.updatable
+    with pytest.raises(ValueError, match="load_schema"):
+        loaded.apply_delta(removed=[("a", RDFS + "subClassOf", "b")])
+    loaded.load_schema(str(ontology_nt), "nt")
+    assert loaded.updatable
+
+
+def test_recommendation_apply_delta(
+    tmp_path, ontology_nt, lines, write_config
+):
+    # Com compact_trees, as árvores em dicionários e o esquema só são
+    # carregados na primeira atualização
+    missing = tmp_path / "missing.pkl"
+    recommendation = Recommendation(
+        config_path=write_config(
+            ontology_filename=ontology_nt,
+            ontology_format="nt",
+            trees_filename=missing,
+            compact_trees="yes",
+        )
+    )
+    assert recommendation.onto_trees is None
+    before = [
+        unordered(recommendation.get_recommendations(q))
+        for q in questions(recommendation)
+    ]
+
+    removed_lines = set(random.Random(0).sample(schema_lines(lines), 30))
+    new_path = write_lines(
+        tmp_path / "new.nt",
+        [line for n, line in enumerate(lines) if n not in removed_lines],
+    )
+    new_triples = set(read_schema_triples(str(new_path), "nt"))
+    recommendation.apply_delta(
+        removed=[
+            triple
+            for triple in read_schema_triples(str(ontology_nt), "nt")
+            if triple not in new_triples
+        ]
+    )
+    assert recommendation.onto_trees.updatable
+
+    fresh = Recommendation(
+        config_path=write_config(
+            name="fresh.ini",
+            ontology_filename=new_path,
+            ontology_format="nt",
+            trees_filename=missing,
+            compact_trees="yes",
+        )
+    )
+    # As árvores atualizadas são iguais às reconstruídas a menos da ordem dos
+    # filhos, que decide os empates da ordem semântica (por exemplo, quando
+    # a propriedade da pergunta não tem nome)
+    after = [
+        unordered(recommendation.get_recommendations(q))
+        for q in questions(fresh)
+    ]
+    assert after == [
+        unordered(fresh.get_recommendations(q)) for q in questions(fresh)
+    ]
+    assert after != before
@@ -0,0 +1,178 @@
+import numpy as np
+import pytest
+
+from ontotrees import Node, NodeEmbeddings, WordVectors
+from ontotrees.embeddings import _rank
+
+# Vetores fixos, com "filme" e "cinema" na mesma direção (empate)
+WORDS = {
+    "filme": [1.0, 0.0, 0.0, 0.0],
+    "cinema": [2.0, 0.0, 0.0, 0.0],
+    "diretor": [0.6, 0.8, 0.0, 0.0],
+    "genero": [0.0, 0.0, 1.0, 0.0],
+    "ator": [0.3, -0.2, 0.1, 0.9],
+    "unk": [0.1, 0.1, 0.1, 0.1],
+}
+NAMES = [
+    "Filme",
+    "Diretor do filme",
+    "Cinema",
+    "Gênero",
+    "Ator",
+    "Ator e diretor",
+    "Palavra desconhecida",
+    "Filme",
+]
+
+
+def nodes():
+    result = []
+    for index, name in enumerate(NAMES):
+        node = Node(f"n{index}")
+        node.name = name
+        result.append(node)
+    return result
+
+
+def keyed_vectors(backend):
+    vectors = np.array(list(WORDS.values()), dtype=np.float32)
+    if backend == "npy":
+        return WordVectors(list(WORDS), vectors)
+    from gensim.models import KeyedVectors
+
+    model = KeyedVectors(vector_size=vectors.shape[1])
+    model.add_vectors(list(WORDS), vectors)
+    return model
+
+
+@pytest.mark.parametrize("backend", ["gensim", "npy"])
+def test_scores_match_n_similarity(backend):
+    from gensim.models import KeyedVectors
+
+    reference = keyed_vectors("gensim")
+    assert isinstance(reference, KeyedVectors)
+    items = nodes()
+    node_embeddings = NodeEmbeddings(
+        keyed_vectors(backend), {"classes": {n.data: n for n in items}}
+    )
+    for source in items:
+        scores = node_embeddings.similarities(source, items)
+        for target, score in zip(items, scores):
+            expected = reference.n_similarity(
+                node_embeddings.words(source.name),
+                node_embeddings.words(target.name),
+            )
+            assert score == pytest.approx(expected, abs=1e-6)
+    # Palavras fora do vocabulário são trocadas por "unk"
+    assert node_embeddings.words("Palavra desconhecida") == ["unk", "unk"]
+
+
+def test_rank_breaks_ties_by_position():
+    items = nodes()
+    node_embeddings = NodeEmbeddings(
+        keyed_vectors("npy"), {"classes": {n.data: n for n in items}}
+    )
+    source = items[0]
+    ranked = node_embeddings.rank(source, items)
+    # "Filme", "Cinema" e o segundo "Filme" empatam com similaridade 1 e
+    # mantêm a ordem original
+    assert [node.data for node in ranked[:3]] == ["n0", "n2", "n7"]
+    for limit in range(1, len(items) + 1):
+        assert node_embeddings.rank(source, items, limit=limit) == (
+            ranked[:limit]
+        )
+    # Os alvos abaixo do limiar são descartados
+    assert node_embeddings.rank(source, items, threshold=0.99) == ranked[:3]
+
+
+def test_rank_ties_with_partial_selection():
+    scores = np.array([0.5, 0.9, 0.5, 0.9, 0.1, 0.5, 0.9], dtype=np.float32)
+    targets = list("abcdefg")
+    assert _rank(scores, targets) == list("bdgacfe")
+    # O limite cai no meio de um grupo empatado
+    assert _rank(scores, targets, limit=2) == list("bd")
+    assert _rank(scores, targets, limit=4) == list("bdga")
+    assert _rank(scores, targets, threshold=0.5, limit=10) == list("bdgacf")
+    # A ordem não depende da ordem dos empates na entrada
+    for seed in range(5):
+        permutation = np.random.default_rng(seed).permutation(len(targets))
+        shuffled = [targets[index] for index in permutation]
+        ranked = _rank(scores[permutation], shuffled)
+        expected = sorted(
+            shuffled,
+            key=lambda target: (
+                -scores[targets.index(target)],
+                shuffled.index(target),
+            ),
+        )
+        assert ranked == expected
+
+
+def test_convert_then_mmap(tmp_path, model_path):
+    from gensim.models import KeyedVectors
+
+    from ontotrees import convert_word2vec, load_word_vectors
+
+    target = str(tmp_path / "model.npy")
+    converted = convert_word2vec(str(model_path), target)
+    loaded = load_word_vectors(target)
+    assert isinstance(loaded.vectors, np.memmap)
+    assert (tmp_path / "model.vocab").exists()
+    reference = KeyedVectors.load_word2vec_format(str(model_path))
+    assert loaded.words == converted.words == list(reference.index_to_key)
+    assert loaded.vector_size == reference.vector_size
+    np.testing.assert_allclose(
+        loaded[loaded.words], reference[loaded.words], atol=1e-6
+    )
+    assert "missing" not in loaded
+
+
+@pytest.mark.parametrize("trees_name", ["ontology.trees", "missing.pkl"])
+def test_convert_script_prunes_with_any_trees(
+    tmp_path, model_path, onto_trees, trees_name
+):
+    # --trees aceita o formato binário e, se o arquivo não existir, as
+    # árvores são construídas a partir do --ontology
+    import subprocess
+    import sys
+
+    from conftest import LABELS, ONTOLOGY, ROOT
+    from ontotrees import load_word_vectors
+
+    # Modelo com palavras que não aparecem nos nomes dos nós
+    lines = model_path.read_text().splitlines()
+    count, size = lines[0].split()
+    extra = [
+        f"extra{index} " + " ".join(["0.5"] * int(size)) for index in range(3)
+    ]
+    source = tmp_path / "model.txt"
+    source.write_text(
+        "\n".join([f"{int(count) + len(extra)} {size}"] + lines[1:] + extra)
+        + "\n"
+    )
+    trees_path = tmp_path / trees_name
+    if trees_name.endswith(".trees"):
+        onto_trees.save(str(trees_path))
+    target = tmp_path / "pruned.npy"
+    subprocess.run(
+        [
+            sys.executable,
+            str(ROOT / "convert_embeddings.py"),
+            str(source),
+            str(target),
+            "--prune",
+            "--trees",
+            str(trees_path),
+            "--ontology",
+            str(ONTOLOGY),
+            "--ontology-format",
+            "ttl",
+            "--labels",
+            str(LABELS),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    pruned = load_word_vectors(str(target))
+    assert set(pruned.words) == set(onto_trees.vocabulary())
+    assert len(pruned) == int(count)
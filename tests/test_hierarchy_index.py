@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from ontotrees import HierarchyIndex, Node
+
+
+def random_tree(rng, size, multiple=0.2, cycles=0):
+    # Árvore com herança múltipla (um segundo pai) e, opcionalmente,
+    # arestas que formam ciclos
+    tree = {key: Node(key) for key in map(str, range(size))}
+    for child in range(1, size):
+        parents = {rng.randrange(child)}
+        if rng.random() < multiple:
+            parents.add(rng.randrange(child))
+        for parent in parents:
+            tree[str(parent)].add_child(str(child))
+    for _ in range(cycles):
+        tree[str(rng.randrange(size))].add_child(str(rng.randrange(size)))
+    return tree
+
+
+def brute_ancestors(tree):
+    # Ancestrais pela definição: pais (via children) e os ancestrais deles.
+    # Nós em ciclos (e abaixo deles) ficam fora, como no índice.
+    parents = {key: set() for key in tree}
+    for key, node in tree.items():
+        for child in node.children:
+            if child in tree:
+                parents[child].add(key)
+    ancestors = dict()
+    pending = set(tree)
+    while True:
+        ready = [
+            key
+            for key in pending
+            if all(parent in ancestors for parent in parents[key])
+        ]
+        if not ready:
+            return ancestors
+        for key in ready:
+            ancestors[key] = frozenset(
+                parents[key].union(*(ancestors[p] for p in parents[key]))
+            )
+            pending.discard(key)
+
+
+def assert_matches(index, tree):
+    expected = brute_ancestors(tree)
+    assert set(index) == set(expected)
+    assert len(index) == len(expected)
+    for key in tree:
+        assert index.ancestors(key) == expected.get(key, frozenset())
+        for other in tree:
+            assert index.is_descendant(key, other) == (
+                other in expected.get(key, ())
+            )
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_matches_brute_force(seed):
+    rng = random.Random(seed)
+    tree = random_tree(rng, rng.randrange(1, 40), cycles=seed % 3)
+    assert_matches(HierarchyIndex(tree), tree)
+
+
+def test_ontology_classes(onto_trees):
+    tree = onto_trees.trees["classes"]
+    index = HierarchyIndex(tree)
+    assert_matches(index, tree)
+    thing = onto_trees.roots["classes"]
+    assert index.ancestors("http://dbpedia.org/ontology/Actor") == {
+        thing,
+        "http://dbpedia.org/ontology/Person",
+    }
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_update_matches_rebuild(seed):
+    rng = random.Random(seed)
+    tree = random_tree(rng, 30, cycles=seed % 2)
+    index = HierarchyIndex(tree)
+    for _ in range(5):
+        before = brute_ancestors(tree)
+        keys = set()
+        for _ in range(rng.randrange(1, 4)):
+            key = str(rng.randrange(33))
+            if key in tree and rng.random() < 0.2:
+                del tree[key]
+            else:
+                node = tree.setdefault(key, Node(key))
+                if node.children and rng.random() < 0.5:
+                    node.remove_child(rng.choice(node.children))
+                else:
+                    node.add_child(str(rng.randrange(33)))
+            keys.add(key)
+        changed = index.update(tree, keys)
+        assert_matches(index, tree)
+        after = brute_ancestors(tree)
+        assert changed == {
+            key
+            for key in set(before) | set(after)
+            if before.get(key) != after.get(key)
+        }
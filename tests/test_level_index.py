@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from ontotrees import LevelIndex, Node
+
+
+def random_tree(rng, size, multiple=0.2):
+    # Hierarquia sem ciclos: node.parent é o primeiro pai e, com herança
+    # múltipla, o nó também é filho de um segundo pai
+    tree = {key: Node(key) for key in map(str, range(size))}
+    for child in range(1, size):
+        parent = str(rng.randrange(child))
+        tree[str(child)].parent = parent
+        tree[parent].add_child(str(child))
+        if rng.random() < multiple:
+            tree[str(rng.randrange(child))].add_child(str(child))
+    return tree
+
+
+def parent_walk(tree, key, k, stop=None):
+    for _ in range(k):
+        if key == stop or tree[key].parent not in tree:
+            break
+        key = tree[key].parent
+    return key
+
+
+def breadth_first(tree, key, depth):
+    # A busca em largura da Recommendation (sem o índice)
+    result = []
+    current = [key]
+    for _ in range(depth):
+        result.extend(current)
+        current = [
+            child
+            for item in current
+            for child in tree[item].children
+            if child in tree
+        ]
+    return result
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_ancestor_matches_parent_walk(seed):
+    rng = random.Random(seed)
+    tree = random_tree(rng, rng.randrange(1, 200))
+    index = LevelIndex(tree)
+    for key in tree:
+        assert parent_walk(tree, key, index.depth(key)) == "0"
+        stop = rng.choice(list(tree))
+        for k in range(0, 12):
+            assert index.ancestor(key, k) == parent_walk(tree, key, k)
+            assert index.ancestor(key, k, stop) == parent_walk(
+                tree, key, k, stop
+            )
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_descendants_match_breadth_first(seed):
+    rng = random.Random(seed)
+    tree = random_tree(rng, rng.randrange(1, 200), multiple=0.3)
+    index = LevelIndex(tree)
+    assert index.available
+    for key in tree:
+        for depth in range(1, 6):
+            assert list(index.descendants(key, depth)) == breadth_first(
+                tree, key, depth
+            )
+
+
+def test_too_large():
+    # Com muita herança múltipla, a numeração passaria de max_size
+    tree = random_tree(random.Random(0), 100, multiple=1)
+    assert not LevelIndex(tree, max_size=50).available
+    index = LevelIndex(tree, max_size=50)
+    assert index.ancestor("99", 3) == parent_walk(tree, "99", 3)
+
+
+def test_cycles():
+    # Os ciclos terminam nas duas consultas
+    tree = random_tree(random.Random(0), 20)
+    tree["0"].parent = "19"
+    tree["19"].add_child("0")
+    index = LevelIndex(tree)
+    assert all(index.ancestor(key, 100) in tree for key in tree)
+    assert set(index.descendants("0", 100)) == set(tree)
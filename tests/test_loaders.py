@@ -0,0 +1,81 @@
+import pytest
+
+from conftest import LABELS, ONTOLOGY, same_trees
+from ontotrees import OntologyTrees
+
+
+def load(method, *args, lang=None, **kwargs):
+    trees = OntologyTrees(lang, labels_filename=str(LABELS))
+    getattr(trees, method)(*args, **kwargs)
+    return trees
+
+
+# Com lang=None, o nome de um nó com labels em vários idiomas depende da
+# ordem das triplas no rdflib.Graph
+@pytest.mark.parametrize("lang", ["en", "pt", ""])
+def test_stream_matches_graph(ontology_nt, lang):
+    graph = load("load_ontology", str(ONTOLOGY), format="ttl", lang=lang)
+    same_trees(
+        graph.trees,
+        load("load_ontology_stream", str(ONTOLOGY), "ttl", lang=lang).trees,
+        ordered=False,
+    )
+    # N-Triples é lido linha a linha pelo parser do rdflib, que repassa as
+    # triplas para o _SinkGraph sem montar um grafo
+    same_trees(
+        graph.trees,
+        load("load_ontology_stream", str(ontology_nt), "nt", lang=lang).trees,
+        ordered=False,
+    )
+    assert (
+        graph.roots
+        == load(
+            "load_ontology_stream", str(ontology_nt), "nt", lang=lang
+        ).roots
+    )
+
+
+def test_stream_progress(ontology_nt):
+    calls = []
+    load(
+        "load_ontology_stream",
+        str(ontology_nt),
+        "nt",
+        progress=lambda stage, count: calls.append((stage, count)),
+        chunk_size=100,
+    )
+    triples = sum(1 for line in open(ontology_nt) if line.strip())
+    # Cada etapa informa as triplas lidas até o momento
+    for stage in ("schema", "labels"):
+        counts = [count for name, count in calls if name == stage]
+        assert counts == list(range(100, len(counts) * 100 + 1, 100))
+    assert len(calls) >= triples // 100
+
+
+@pytest.fixture(scope="module")
+def shards(ontology_nt, tmp_path_factory):
+    # Divide o arquivo N-Triples em três partes contíguas, de forma que a
+    # concatenação seja o arquivo original
+    lines = ontology_nt.read_text(encoding="utf-8").splitlines(True)
+    directory = tmp_path_factory.mktemp("shards")
+    size = len(lines) // 3 + 1
+    paths = []
+    for number, start in enumerate(range(0, len(lines), size)):
+        path = directory / f"shard{number}.nt"
+        path.write_text("".join(lines[start : start + size]), encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_parallel_matches_stream(ontology_nt, shards, workers):
+    stream = load("load_ontology_stream", str(ontology_nt), "nt")
+    parallel = load("load_ontology_parallel", shards, "nt", workers=workers)
+    same_trees(stream.trees, parallel.trees)
+    assert stream.roots == parallel.roots
+
+
+def test_parallel_keep_schema(shards):
+    assert not load("load_ontology_parallel", shards, "nt").updatable
+    trees = load("load_ontology_parallel", shards, "nt", keep_schema=True)
+    assert trees.updatable
@@ -0,0 +1,91 @@
+import pickle
+import struct
+
+import pytest
+
+from conftest import ROOT, questions, same_trees
+from ontotrees import MappedOntologyTrees, load_trees, save_trees
+from recommendations import Recommendation, ReloadableRecommendation
+
+
+@pytest.fixture
+def trees_path(tmp_path):
+    # As árvores do ontology_trees.pkl no formato binário
+    with open(ROOT / "ontology_trees.pkl", "rb") as trees_file:
+        onto_trees = pickle.load(trees_file)
+    path = tmp_path / "ontology.trees"
+    save_trees(str(path), onto_trees.trees, onto_trees.roots, onto_trees.lang)
+    return path
+
+
+def test_round_trip(tmp_path, onto_trees):
+    path = tmp_path / "ontology.trees"
+    onto_trees.save(str(path))
+    with load_trees(str(path)) as mapped:
+        assert isinstance(mapped, MappedOntologyTrees)
+        same_trees(onto_trees.trees, mapped.trees)
+        same_trees(onto_trees.compact(), mapped.compact())
+        assert mapped.roots == onto_trees.roots
+        assert mapped.trees_names == onto_trees.trees_names
+        assert mapped.lang == onto_trees.lang
+        tree = mapped.get_tree("classes")
+        assert "http://example.org/missing" not in tree
+        assert tree.get_node_id("http://example.org/missing") == -1
+    assert mapped.closed
+
+
+def test_close(trees_path):
+    mapped = load_trees(str(trees_path))
+    tree = mapped.trees["classes"]
+    key = next(iter(tree))
+    assert tree[key].data == key
+    mapped.close()
+    mapped.close()
+    assert mapped.closed
+    with pytest.raises(ValueError):
+        tree[key].data
+
+
+@pytest.mark.parametrize(
+    "offset, value, message",
+    [
+        (0, b"NOTTREES", "is not an ontology trees file"),
+        (8, struct.pack("<I", 99), "format version 99"),
+    ],
+)
+def test_invalid_file(trees_path, offset, value, message):
+    data = bytearray(trees_path.read_bytes())
+    data[offset : offset + len(value)] = value
+    trees_path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match=message):
+        load_trees(str(trees_path))
+
+
+def test_recommendation(trees_path, write_config):
+    pickled = Recommendation(config_path=write_config())
+    mapped = Recommendation(
+        config_path=write_config(trees_filename=trees_path)
+    )
+    assert "trees_mmap" in mapped.startup_times
+    for question in questions(pickled):
+        assert mapped.get_recommendations(
+            question
+        ) == pickled.get_recommendations(question)
+
+    mapped.close()
+    assert mapped.closed
+    with pytest.raises(ValueError):
+        mapped.get_recommendations(questions(pickled)[0])
+
+
+def test_reload_closes_previous(trees_path, write_config):
+    reloadable = ReloadableRecommendation(
+        write_config(trees_filename=trees_path)
+    )
+    question = questions(reloadable.current)[0]
+    expected = reloadable.get_recommendations(question)
+    previous = reloadable.current
+    reloadable.reload()
+    assert previous.closed
+    assert not reloadable.current.closed
+    assert reloadable.get_recommendations(question) == expected
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from ontotrees import NeighborIndex, Node, NodeEmbeddings, WordVectors
+
+
+def clustered_embeddings(size=2000, dimension=16, clusters=40, seed=0):
+    # Um nó por palavra, com vetores agrupados em torno de "clusters"
+    # centros (como os nomes de uma ontologia, que se repetem por área)
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension))
+    vectors = centers[rng.integers(clusters, size=size)]
+    vectors += 0.3 * rng.normal(size=(size, dimension))
+    words = [f"w{index}" for index in range(size)]
+    word_vectors = WordVectors(
+        words + ["unk"],
+        np.vstack([vectors, np.zeros((1, dimension))]).astype(np.float32),
+    )
+    tree = dict()
+    for word in words:
+        tree[word] = Node(word)
+        tree[word].name = word
+    return NodeEmbeddings(word_vectors, {"classes": tree}), words
+
+
+def brute_force(vectors, vector, k):
+    # Os k mais similares, com empates na ordem das chaves
+    scores = vectors @ vector
+    return np.lexsort((np.arange(len(scores)), -scores))[:k]
+
+
+@pytest.fixture(scope="module")
+def embeddings():
+    return clustered_embeddings()
+
+
+@pytest.mark.parametrize("block_size", [4096, 100, 7])
+def test_exact_matches_brute_force(embeddings, block_size):
+    node_embeddings, words = embeddings
+    index = NeighborIndex(node_embeddings, words, block_size=block_size)
+    for position in range(0, len(words), 97):
+        vector = index.vectors[position]
+        for k in (1, 10, 50):
+            assert list(index.search(vector, k)) == list(
+                brute_force(index.vectors, vector, k)
+            )
+
+
+def test_iter_neighbors(embeddings):
+    node_embeddings, words = embeddings
+    index = NeighborIndex(node_embeddings, words, block_size=100)
+    # A busca é refeita com mais vizinhos sem repetir os anteriores
+    neighbors = list(index.iter_neighbors(words[0], k=4))
+    expected = brute_force(index.vectors, index.vectors[0], len(words))
+    assert neighbors == [words[position] for position in expected[1:]]
+    assert index.neighbors(words[0], 5) == neighbors[:5]
+    assert list(index.iter_neighbors("missing")) == []
+
+
+@pytest.mark.parametrize("probes, bound", [(1, 0.85), (2, 0.95)])
+def test_approximate_recall(embeddings, probes, bound):
+    node_embeddings, words = embeddings
+    index = NeighborIndex(
+        node_embeddings, words, approximate=True, probes=probes
+    )
+    recall = []
+    for position in range(200):
+        vector = index.vectors[position]
+        expected = set(brute_force(index.vectors, vector, 10))
+        recall.append(len(expected & set(index.search(vector, 10))) / 10)
+    assert np.mean(recall) >= bound
+
+
+def test_approximate_with_all_lists_is_exact(embeddings):
+    node_embeddings, words = embeddings
+    index = NeighborIndex(node_embeddings, words, approximate=True)
+    index.probes = len(index._lists)
+    for position in range(0, len(words), 97):
+        vector = index.vectors[position]
+        assert list(index.search(vector, 10)) == list(
+            brute_force(index.vectors, vector, 10)
+        )
@@ -0,0 +1,107 @@
+import gc
+import pickle
+
+import pytest
+
+from conftest import ROOT, questions
+from ontotrees import save_trees
+from recommendations import (
+    EmbeddingStore,
+    OntologyRegistry,
+    Recommendation,
+    ReloadableRecommendation,
+)
+
+
+@pytest.fixture
+def configs(tmp_path, write_config):
+    # Duas ontologias (a mesma, com árvores mapeadas) que usam o mesmo
+    # modelo de embeddings
+    with open(ROOT / "ontology_trees.pkl", "rb") as trees_file:
+        onto_trees = pickle.load(trees_file)
+    trees_path = tmp_path / "ontology.trees"
+    save_trees(str(trees_path), onto_trees.trees, onto_trees.roots)
+    return {
+        name: write_config(name=f"{name}.ini", trees_filename=trees_path)
+        for name in ("movies", "films")
+    }
+
+
+def test_loads_on_first_question(configs):
+    registry = OntologyRegistry(configs)
+    assert registry.names == ["movies", "films"]
+    assert registry.loaded() == []
+    expected = Recommendation(config_path=configs["movies"])
+    for question in questions(expected)[:10]:
+        assert registry.get_recommendations(
+            "movies", question
+        ) == expected.get_recommendations(question)
+    assert registry.loaded() == ["movies"]
+    with pytest.raises(ValueError, match="Unknown ontology"):
+        registry.get("books")
+
+
+def test_eviction_closes(configs):
+    registry = OntologyRegistry(configs, max_loaded=1)
+    movies = registry.get("movies")
+    question = questions(movies)[0]
+    expected = registry.get_recommendations("movies", question)
+    registry.get_recommendations("films", question)
+    assert registry.loaded() == ["films"]
+    assert movies.closed
+    # A ontologia descarregada é carregada novamente na próxima pergunta
+    assert registry.get_recommendations("movies", question) == expected
+    assert registry.get("movies") is not movies
+
+    movies = registry.get("movies")
+    registry.unload("movies")
+    assert movies.closed
+    assert registry.loaded() == []
+
+
+def test_shared_embeddings(configs):
+    store = EmbeddingStore()
+    registry = OntologyRegistry(configs, embedding_store=store)
+    movies, films = registry.get("movies"), registry.get("films")
+    assert movies.embeddings is not None
+    assert movies.embeddings is films.embeddings
+    assert len(store) == 1
+
+    # O modelo é liberado quando nenhuma ontologia carregada o utiliza
+    model_path = movies.model_path
+    del movies, films
+    registry.unload("movies")
+    gc.collect()
+    assert model_path in store
+    registry.unload("films")
+    gc.collect()
+    assert model_path not in store
+    assert len(store) == 0
+
+
+def test_reloadable_uses_store(configs):
+    store = EmbeddingStore()
+    reloadable = ReloadableRecommendation(
+        configs["movies"], embedding_store=store
+    )
+    model = reloadable.current.embeddings
+    assert store.get(reloadable.current.model_path) is model
+    reloadable.reload()
+    assert reloadable.current.embeddings is model
+    assert len(store) == 1
+
+
+def test_from_config(tmp_path, configs):
+    path = tmp_path / "ontologies.ini"
+    path.write_text(
+        "[DEFAULT]\nmax_loaded = 1\n\n"
+        + "".join(
+            f"[{name}]\nconfig_path = {config_path.rsplit('/', 1)[-1]}\n\n"
+            for name, config_path in configs.items()
+        )
+    )
+    registry = OntologyRegistry.from_config(str(path))
+    assert registry.names == ["movies", "films"]
+    question = questions(registry.get("movies"))[0]
+    registry.get_recommendations("films", question)
+    assert registry.loaded() == ["films"]
@@ -0,0 +1,39 @@
+import pytest
+
+import ontotrees
+import recommendations
+from conftest import questions
+from recommendations import ReloadableRecommendation
+
+
+def test_reload_builds_before_swap(monkeypatch, write_config):
+    reloadable = ReloadableRecommendation(
+        write_config(order="semantic", neighbors=2)
+    )
+    question_list = questions(reloadable.current)
+    expected = [reloadable.get_recommendations(q) for q in question_list]
+    snapshot = reloadable.reload()
+    assert reloadable.current is snapshot
+
+    # Depois da troca, nenhuma pergunta constrói índices ou embeddings
+    def built(*args, **kwargs):
+        raise AssertionError("built after the reload")
+
+    for name in ("HierarchyIndex", "DomainRangeIndex", "LevelIndex"):
+        monkeypatch.setattr(recommendations, name, built)
+    for name in ("NodeEmbeddings", "NeighborIndex"):
+        monkeypatch.setattr(ontotrees, name, built)
+    assert [
+        reloadable.get_recommendations(q) for q in question_list
+    ] == expected
+
+
+def test_warm_is_idempotent(write_config):
+    reloadable = ReloadableRecommendation(write_config())
+    snapshot = reloadable.current
+    snapshot.warm()
+    indexes = dict(snapshot.indexes)
+    node_embeddings = snapshot.node_embeddings
+    assert snapshot.warm() is snapshot
+    assert snapshot.indexes == indexes
+    assert snapshot.node_embeddings is node_embeddings
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import threading
+
+from conftest import M, questions
+from recommendations import Recommendation
+from server import RecommendationServer
+
+
+def exchange(server, requests, before_reading=None):
+    # Envia as requisições (uma por linha) por uma única conexão com o
+    # servidor em uma porta livre e retorna as respostas na ordem recebida
+    async def run():
+        tcp_server = await asyncio.start_server(server._handle, "127.0.0.1", 0)
+        port = tcp_server.sockets[0].getsockname()[1]
+        async with tcp_server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            for request in requests:
+                if not isinstance(request, str):
+                    request = json.dumps(request)
+                writer.write((request + "\n").encode("utf-8"))
+            await writer.drain()
+            if before_reading is not None:
+                await before_reading()
+            responses = [json.loads(await reader.readline()) for _ in requests]
+            writer.close()
+            await writer.wait_closed()
+        return responses
+
+    return asyncio.run(run())
+
+
+class EchoRecommendation:
+    # Responde com a pergunta e os parâmetros recebidos, esperando release
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def get_recommendations(self, question, params=None):
+        self.release.wait(5)
+        self.calls += 1
+        return "echo", [json.dumps([question, params], sort_keys=True)]
+
+    def cache_info(self):
+        return {}
+
+
+def test_coalescing():
+    recommendation = EchoRecommendation()
+    server = RecommendationServer(recommendation, workers=2, batch_window=0)
+    question = [[M + "Movie", M + "hasDirector", M + "Director"]]
+    params = {"order": "semantic", "extra": [1, {"b": 2, "a": 1}]}
+    same_params = {"extra": [1, {"a": 1, "b": 2}], "order": "semantic"}
+
+    async def release():
+        # As três requisições chegam antes de o cálculo terminar
+        while server.requests < 3:
+            await asyncio.sleep(0.01)
+        recommendation.release.set()
+
+    responses = exchange(
+        server,
+        [
+            {"id": 1, "question": question, "params": params},
+            {"id": 2, "question": question, "params": same_params},
+            {"id": 3, "question": question, "params": {"depth": 2}},
+        ],
+        release,
+    )
+    by_id = {response["id"]: response for response in responses}
+    assert set(by_id) == {1, 2, 3}
+    assert all("error" not in response for response in responses)
+    assert by_id[1]["recommendations"] == by_id[2]["recommendations"]
+    assert by_id[1]["recommendations"] != by_id[3]["recommendations"]
+    assert recommendation.calls == 2
+    assert server.stats() == {
+        "requests": 3,
+        "coalesced": 1,
+        "in_flight": 0,
+        "cache": {},
+    }
+
+
+def test_recommendations_and_errors(write_config):
+    recommendation = Recommendation(config_path=write_config())
+    server = RecommendationServer(recommendation, workers=4)
+    question_list = questions(recommendation)[:5]
+    responses = exchange(
+        server,
+        [
+            {"id": number, "question": question, "params": {"depth": 2}}
+            for number, question in enumerate(question_list)
+        ]
+        + [
+            "not json",
+            {"id": "missing"},
+            {"id": "metrics", "metrics": True},
+            {"id": "stats", "stats": True},
+        ],
+    )
+    by_id = {response.get("id"): response for response in responses}
+    for number, question in enumerate(question_list):
+        suggestion_text, expected = recommendation.get_recommendations(
+            question, params={"depth": 2}
+        )
+        assert by_id[number] == {
+            "id": number,
+            "suggestion_text": suggestion_text,
+            "recommendations": expected,
+        }
+    # Uma linha inválida não tem id, e as demais respostas continuam
+    assert by_id[None]["error"].startswith("JSONDecodeError")
+    assert by_id["missing"]["error"] == "KeyError: 'question'"
+    assert "Tracing is not enabled" in by_id["metrics"]["error"]
+    assert by_id["stats"]["requests"] == len(question_list)
+    assert "cache" in by_id["stats"]
+    # As similaridades passam pelo SimilarityBatcher
+    assert "similarity_batches" in by_id["stats"]
+
+
+def test_metrics(write_config):
+    recommendation = Recommendation(config_path=write_config())
+    recommendation.enable_tracing()
+    server = RecommendationServer(recommendation)
+    question = questions(recommendation)[0]
+    responses = exchange(
+        server, [{"id": 1, "question": question}, {"id": 2, "metrics": True}]
+    )
+    metrics = {response["id"]: response for response in responses}[2]
+    assert "ontoexplorer_request_seconds_count" in metrics["metrics"]
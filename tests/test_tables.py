@@ -0,0 +1,95 @@
+import itertools
+import os
+import shutil
+
+import pytest
+
+from conftest import ROOT, questions
+from recommendations import Recommendation
+
+CONFIGS = [
+    dict(order=order, filter_by=filter_by, family_position=position)
+    for order, filter_by, position in itertools.product(
+        ["", "semantic"], ["domain", "range", "both"], [0, -2]
+    )
+]
+
+
+@pytest.fixture
+def recommendation(tmp_path, write_config):
+    # Cópia das árvores, para que a data de modificação possa ser alterada
+    trees_path = tmp_path / "ontology_trees.pkl"
+    shutil.copy(ROOT / "ontology_trees.pkl", trees_path)
+    return Recommendation(config_path=write_config(trees_filename=trees_path))
+
+
+def without_tables(recommendation):
+    recommendation.tables = None
+    return recommendation
+
+
+@pytest.mark.parametrize("params", CONFIGS)
+def test_tables_match_search(tmp_path, recommendation, params):
+    base = recommendation.with_params(params)
+    tables = base.build_tables(str(tmp_path / "tables.pkl"))
+    assert tables
+    for size in [1, 3, 50]:
+        variant = base.with_params({"size": size})
+        got = [variant.get_recommendations(q) for q in questions(base)]
+        without_tables(variant)
+        expected = [variant.get_recommendations(q) for q in questions(base)]
+        assert got == expected
+
+
+def test_load_tables(tmp_path, recommendation, write_config):
+    tables_path = tmp_path / "tables.pkl"
+    recommendation.build_tables(str(tables_path))
+    config_path = write_config(
+        trees_filename=recommendation.trees_path, tables_filename=tables_path
+    )
+    loaded = Recommendation(config_path=config_path)
+    assert loaded.tables == recommendation.tables
+
+    # As tabelas de outra configuração são carregadas, mas não consultadas
+    other = recommendation.with_params({"filter_by": "domain"})
+    assert other._lookup_table(next(iter(other.tables)), "classes", 1) is None
+
+
+def test_tables_ignored_after_trees_change(tmp_path, recommendation, capsys):
+    tables_path = tmp_path / "tables.pkl"
+    recommendation.build_tables(str(tables_path))
+    stat = os.stat(recommendation.trees_path)
+    os.utime(
+        recommendation.trees_path,
+        ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9),
+    )
+    recommendation.load_tables(str(tables_path))
+    assert recommendation.tables is None
+    assert "build_tables again" in capsys.readouterr().out
+
+
+def test_stale_keys_fall_back_to_search(tmp_path, recommendation):
+    tables = recommendation.build_tables(str(tmp_path / "tables.pkl"))
+    expected = [
+        recommendation.get_recommendations(q)
+        for q in questions(recommendation)
+    ]
+    # Nós que não existem mais nas árvores invalidam apenas a entrada
+    for key in tables:
+        tables[key] = ("http://example.org/removed",) + tables[key]
+    got = [
+        recommendation.get_recommendations(q)
+        for q in questions(recommendation)
+    ]
+    assert got == expected
+
+
+def test_max_pairs(tmp_path, recommendation, capsys):
+    recommendation = recommendation.with_params({"filter_by": "both"})
+    full = recommendation.build_tables(str(tmp_path / "full.pkl"))
+    partial = recommendation.build_tables(
+        str(tmp_path / "partial.pkl"), max_pairs=1
+    )
+    assert "were not materialized" in capsys.readouterr().out
+    assert set(partial) < set(full)
+    assert all(full[key] == value for key, value in partial.items())
@@ -0,0 +1,90 @@
+from conftest import M
+from ontotrees import Tracer
+from recommendations import Recommendation
+
+QUESTION = [
+    (M + "Movie", "has_value", "Avatar"),
+    (M + "Movie", M + "belongsToGenre", M + "Genre"),
+]
+
+
+def metric(text, line_start):
+    # Valor da linha do formato texto do Prometheus que começa com line_start
+    values = [
+        float(line.rsplit(" ", 1)[1])
+        for line in text.splitlines()
+        if line.startswith(line_start + " ")
+    ]
+    assert len(values) == 1, line_start
+    return values[0]
+
+
+def test_stages_and_counts(write_config):
+    recommendation = Recommendation(config_path=write_config(cache_size=10))
+    expected = recommendation.get_recommendations(QUESTION)
+    traces = []
+    tracer = recommendation.enable_tracing(traces.append)
+
+    # A primeira chamada calcula as recomendações, e a segunda é respondida
+    # pelo cache
+    recommendation.cache.clear()
+    assert recommendation.get_recommendations(QUESTION) == expected
+    assert recommendation.get_recommendations(QUESTION) == expected
+
+    assert tracer.calls == len(traces) == 2
+    first, cached = traces
+    assert set(first["times"]) >= {"entities", "search", "similarity"}
+    assert first["counts"]["nodes_visited"] > 0
+    assert first["counts"]["embedding_lookups"] > 0
+    assert first["counts"]["cache_misses"] == 1
+    assert cached["counts"]["cache_hits"] == 1
+    assert "search" not in cached["times"]
+    assert all(
+        trace["total"] >= sum(trace["times"].values()) for trace in traces
+    )
+    assert tracer.counts["nodes_visited"] == sum(
+        trace["counts"].get("nodes_visited", 0) for trace in traces
+    )
+
+    text = tracer.prometheus()
+    name = "ontoexplorer_request_seconds"
+    assert "# TYPE ontoexplorer_request_seconds histogram" in text
+    assert metric(text, f"{name}_count") == 2
+    assert metric(text, f'{name}_bucket{{le="+Inf"}}') == 2
+    assert metric(text, f"{name}_sum") == tracer.seconds
+    for stage, seconds in tracer.times.items():
+        assert (
+            metric(
+                text, f'ontoexplorer_stage_seconds_total{{stage="{stage}"}}'
+            )
+            == seconds
+        )
+    assert (
+        metric(text, 'ontoexplorer_events_total{event="nodes_visited"}')
+        == tracer.counts["nodes_visited"]
+    )
+    assert (
+        metric(text, 'ontoexplorer_cache_hit_ratio{cache="cache"}')
+        == tracer.hit_rate()
+        == 0.5
+    )
+
+
+def test_variants_share_the_tracer(write_config):
+    recommendation = Recommendation(config_path=write_config())
+    tracer = Tracer(prefix="test")
+    recommendation.enable_tracing(tracer)
+    recommendation.get_recommendations(QUESTION, params={"depth": 1})
+    recommendation.with_params({"order": ""}).get_recommendations(QUESTION)
+    assert tracer.calls == 2
+    assert "test_request_seconds_count 2" in tracer.prometheus()
+
+
+def test_disable(write_config):
+    recommendation = Recommendation(config_path=write_config())
+    with recommendation.tracing() as tracer:
+        recommendation.get_recommendations(QUESTION)
+    recommendation.get_recommendations(QUESTION)
+    assert tracer.calls == 1
+    assert recommendation.tracer is None
+    assert "get_recommendations" not in vars(recommendation)